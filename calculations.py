@@ -1,79 +1,44 @@
 import numpy as np
 import pandas as pd
-from scipy import stats
-import math
 from datetime import datetime
 
+from compact_frame import get_flag
+from compute_plan import mask_indices, gather, scatter
+from prepare_standards import PreparedStandards
+from pressure import qff_kernel, select_qff, p_equ_kernel
+
 
 # function from ICOS workshop,not in use
 def pres_at_sea_level(pressure, temperature_c, height):
     return pressure * pow((1 - (0.0065 * height) / (temperature_c + 0.0065 * height + 273.15)), -5.257)
 
 
-# function used by SMHI
+# function used by SMHI, see pressure.qff_kernel
 def calculate_qff(temperature_c, latitude, height: int, pressure):
-    #  QFF: the air pressure at the monitoring station reduced to sea level, typically using local temperature
-    #  observations (e.g. use "Air_temperature"). This is in contrast to QNH, which is the sea level pressure calculated
-    #  assuming a standard atmosphere.
-    latitude = latitude.fillna(60)
-    temperature_c = temperature_c.fillna(15)
-
-    valid_pressure = (pressure >= 600) & (pressure <= 1100)
-    b = 3.4163 * (1 - 0.0026373 * np.cos(2 * latitude * math.pi)) / 100
-    t1 = pd.Series(np.zeros(len(temperature_c)), index=temperature_c.index)
-
-    bool_low = temperature_c < -7
-    bool_middle = (temperature_c >= -7) & (temperature_c < 2)
-    bool_high = temperature_c >= 2
-
-    t1[bool_low] = temperature_c[bool_low] * 0.5 + 275.0
-    t1[bool_middle] = temperature_c[bool_middle] * 0.535 + 275.6
-    t1[bool_high] = temperature_c[bool_high] * 1.07 + 274.5
-
-    qff = pd.Series(np.nan, index=pressure.index)
-    qff[valid_pressure] = pressure[valid_pressure] * np.exp(height *
-                                                            b[valid_pressure] / t1[valid_pressure])
-    return qff
+    return pd.Series(qff_kernel(temperature_c.to_numpy(dtype=float), latitude.to_numpy(dtype=float), height,
+                                pressure.to_numpy(dtype=float)), index=pressure.index)
 
 
+#  method to get qff with the station constants of the cached station config, see pressure.select_qff
 def get_qff(df: pd.DataFrame) -> pd.DataFrame:
-    df['qff'] = np.nan
-    bool_qff = ((df['time series'] < datetime(2023, 1, 1, 0, 0, 0)) &
-                df['QF QFF'])
-    df.loc[bool_qff, 'qff'] = df.loc[bool_qff, 'QFF']
-    bool_atm_pres = (~bool_qff) & df['QF Atm_pressure'] & df['QF Air_temperature'] & (df['QF Latitude'] < 3)
-    df.loc[bool_atm_pres, 'qff'] = calculate_qff(df.loc[bool_atm_pres, 'Air_temperature'],
-                                                 df.loc[bool_atm_pres, 'Latitude'], 27,
-                                                 df.loc[bool_atm_pres,'Atm_pressure'])
+    df['qff'] = select_qff(df['time series'].to_numpy(), df['QFF'].to_numpy(dtype=float), df['QF QFF'].to_numpy(),
+                           df['QF Atm_pressure'].to_numpy(), df['QF Air_temperature'].to_numpy(),
+                           df['QF Latitude'].to_numpy(dtype=float), df['Air_temperature'].to_numpy(dtype=float),
+                           df['Latitude'].to_numpy(dtype=float), df['Atm_pressure'].to_numpy(dtype=float))
     return df
 
 
-def get_p_equ_p_atm(df: pd.DataFrame) -> pd.DataFrame:
-    df['P_equ'] = np.nan
-    is_pressure = (
-        df['lab press'].notna() &
-        df['QF lab press'] &
-        df['QF equ press']
-    )
-    df.loc[is_pressure, 'P_equ'] = (
-        df.loc[is_pressure, 'lab press'] +
-        df.loc[is_pressure, 'equ press']
-    ) / 1013.25
-
-    is_pressure_2 = (
-        df['licor press'].notna() &
-        df['lab press'].isna() &
-        df['QF licor press'] &
-        df['QF equ press']
-    )
-    df.loc[is_pressure_2, 'P_equ'] = (
-        df.loc[is_pressure_2, 'licor press'] +
-        df.loc[is_pressure_2, 'equ press']
-    ) / 1013.25
-    df['P_equ_is_from_QFF'] = df['P_equ'].isna() & df['qff'].notna()
-    df.loc[df['P_equ_is_from_QFF'], 'P_equ'] = df['qff'] / 1013.25
-
-    df['P_atm_sea'] = df['qff'] / 1013.25
+#  method to compute the equilibrator pressure and the atmospheric pressure at sea level, in atm
+def compute_p_equ_p_atm(df: pd.DataFrame) -> dict:
+    return p_equ_kernel(*gather(df, ['lab press', 'licor press', 'equ press', 'qff'], slice(None)),
+                        *(get_flag(df, col).to_numpy() for col in ['QF lab press', 'QF licor press', 'QF equ press']))
+
+
+#  method to add the pressures to df. The pressures are shared by the co2 and ch4 chains, process_folder computes them
+#  once with compute_p_equ_p_atm and passes them to both chains, without pressures they are computed here.
+def get_p_equ_p_atm(df: pd.DataFrame, pressures: dict = None) -> pd.DataFrame:
+    for col, values in (pressures or compute_p_equ_p_atm(df)).items():
+        df[col] = values.copy()
     return df
 
 
@@ -82,77 +47,196 @@ def get_delta_temperature(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+#  method to get the measured values of a gas, the average where it exists and the raw value otherwise
+def get_measured_values(df: pd.DataFrame, parameter_upper: str, unit: str) -> np.ndarray:
+    avg, raw = gather(df, [f'{parameter_upper} avg {unit}', f'{parameter_upper} {unit}'], slice(None))
+    return np.where(np.isnan(avg), raw, avg)
+
+
+#  method to get the standards used for the calibration
+def get_calibration_standards(standards: list, start_time: datetime) -> list:
+    # only use std1 when there's too few of the others
+    if '1' in standards and len(standards) > 3 and start_time < datetime(2025, 1, 1, 0, 0, 0):
+        standards = [s for s in standards if s != '1']
+    return standards
+
+
+#  method to get the reference and interpolated values of the standards as (rows x standards) arrays, from prepared
+#  (see prepare_standards.prepare_all_standards) when given and otherwise from the standard columns
+def get_standard_matrices(df: pd.DataFrame, parameter: str, standards: list, prepared: PreparedStandards = None):
+    if not standards:
+        return np.empty((len(df), 0)), np.empty((len(df), 0))
+    if prepared is not None:
+        return prepared.get_matrices(parameter, standards)
+    references = np.column_stack([df[f'reference_std{item}_{parameter}'].to_numpy(dtype=float)
+                                  for item in standards])
+    interpolated = np.column_stack([df[f'interpolated_std{item}_{parameter}'].to_numpy(dtype=float)
+                                    for item in standards])
+    return references, interpolated
+
+
+#  method to fit interpolated against reference standard values for every row at once. references and interpolated
+#  are (rows x standards) arrays, NaN where a standard is missing. Gives the same slope, intercept and r as
+#  stats.linregress on each row's valid pairs sorted by reference: rows are grouped by their number of valid pairs and
+#  the means and covariances are computed the way linregress does, on a stack of (2 x n) matrices per group.
+#  is_fit is False for rows with fewer than two pairs, identical references, a non-finite result or r**2 < 0.98.
+def fit_standards(references: np.ndarray, interpolated: np.ndarray) -> dict:
+    n_rows = references.shape[0]
+    is_pair = ~np.isnan(references) & ~np.isnan(interpolated)
+    number_of_standards = is_pair.sum(axis=1)
+
+    # stable sort of the valid pairs on reference, missing pairs last
+    order = np.lexsort((np.where(is_pair, references, 0), ~is_pair), axis=1)
+    references_sorted = np.take_along_axis(references, order, axis=1)
+    interpolated_sorted = np.take_along_axis(interpolated, order, axis=1)
+
+    x_mean = np.full(n_rows, np.nan)
+    y_mean = np.full(n_rows, np.nan)
+    ssxm = np.full(n_rows, np.nan)
+    ssxym = np.full(n_rows, np.nan)
+    ssym = np.full(n_rows, np.nan)
+    is_constant_x = np.zeros(n_rows, dtype=bool)
+    for n in np.unique(number_of_standards[number_of_standards >= 2]):
+        rows = np.flatnonzero(number_of_standards == n)
+        xy = np.ascontiguousarray(np.stack([references_sorted[rows, :n], interpolated_sorted[rows, :n]], axis=1))
+        x_mean[rows] = xy[:, 0, :].mean(axis=1)
+        y_mean[rows] = xy[:, 1, :].mean(axis=1)
+        is_constant_x[rows] = xy[:, 0, :].max(axis=1) == xy[:, 0, :].min(axis=1)
+        xy -= xy.mean(axis=2)[:, :, None]
+        cov = np.matmul(xy, xy.transpose(0, 2, 1))
+        cov *= np.true_divide(1, n)
+        ssxm[rows] = cov[:, 0, 0]
+        ssxym[rows] = cov[:, 0, 1]
+        ssym[rows] = cov[:, 1, 1]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        is_zero = (ssxm == 0.0) | (ssym == 0.0)
+        r = np.where(is_zero, np.where(ssxym == 0, np.nan, 0.0), ssxym / np.sqrt(ssxm * ssym))
+        r = np.clip(r, -1.0, 1.0)
+        slope = ssxym / ssxm
+        intercept = y_mean - slope * x_mean
+        # kept as a loop: the scalar power matches r**2 of linregress, numpy's r**2 differs in the last bit for ~0.1%
+        r_square = np.array([value**2 for value in r.tolist()])
+        is_fit = ((number_of_standards >= 2) & ~is_constant_x & np.isfinite(slope) & np.isfinite(r)
+                  & (r_square >= 0.98))  # from Quantitative Chemical Analysis, Daniel C. Harris
+        max_deviation = np.where(is_pair, np.abs(references - interpolated), -np.inf).max(axis=1, initial=-np.inf)
+
+    return {
+        'slope': slope,
+        'intercept': intercept,
+        'r_square': r_square,
+        'number_of_standards': number_of_standards,
+        'max_deviation': max_deviation,
+        'is_fit': is_fit,
+    }
+
+
+#  method to calibrate the measured values of a gas with the standards. Returns the fit, the calibrated values, the
+#  deviation of the calibrated from the measured values and the quality flag of the measured values, all per row.
+def calibrate(parameter: str, unit: str, df: pd.DataFrame, standards: list, start_time: datetime,
+              prepared: PreparedStandards = None) -> dict:
+    parameter_upper = parameter.upper()
+    parameter = parameter.lower()
+
+    # use avg if existing
+    is_avg = df[f'{parameter_upper} avg {unit}'].notna().to_numpy()
+    values = get_measured_values(df, parameter_upper, unit)
+    qf_measured = np.where(is_avg, get_flag(df, f'QF {parameter_upper} avg {unit}').to_numpy(),
+                           get_flag(df, f'QF {parameter_upper} {unit}').to_numpy())
+
+    standards = get_calibration_standards(standards, start_time)
+    references, interpolated = get_standard_matrices(df, parameter, standards, prepared)
+    fit = fit_standards(references, interpolated)
+    is_fit = fit['is_fit']
+
+    converted_slope = 1 / fit['slope'][is_fit]
+    converted_intercept = (fit['intercept'][is_fit] * -1) / fit['slope'][is_fit]
+    cal = np.full(len(df), np.nan)
+    cal[is_fit] = values[is_fit] * converted_slope + converted_intercept
+    return {
+        'fit': fit,
+        'cal': cal,
+        'calibration_deviation': np.abs(cal - values),
+        'qf_measured': qf_measured,
+    }
+
+
 def correct_based_on_standards(parameter: str,
                                unit: str,
                                df: pd.DataFrame,
                                standards: list,
                                start_time: datetime,
                                calibration_threshold: int = 10,
-                               standard_threshold: int = 10) -> pd.DataFrame:
-    parameter_upper = parameter.upper()
+                               standard_threshold: int = 10,
+                               expand_coefficients: bool = True,
+                               prepared: PreparedStandards = None) -> pd.DataFrame:
+    # the coefficients are fitted per row. Without expand_coefficients the per row slope, intercept, r square and
+    # number of standards are not written, calibration_model.build_calibration_model fits them at other times
     parameter = parameter.lower()
-    df[f'x{parameter}_cal'] = np.nan
-    df[f'standard_slope_{parameter}'] = np.nan
-    df[f'standard_intercept_{parameter}'] = np.nan
-    df[f'standard_r_square_{parameter}'] = np.nan
-    df[f'number_of_standards_{parameter}'] = np.nan
-    df[f'QF x{parameter}_cal'] = True
-
-    # use avg if existing
-    values = df[f'{parameter_upper} avg {unit}'].copy()
-    is_avg = df[f'{parameter_upper} avg {unit}'].notna()
-    is_not_avg = ~is_avg
-    values.loc[is_not_avg] = df.loc[is_not_avg, f'{parameter_upper} {unit}']
-
-    # only use std1 when there's too few of the others
-    if '1' in standards and len(standards) > 3 and start_time < datetime(2025, 1, 1, 0, 0, 0):
-        standards = [s for s in standards if s != '1']
-
-    for idx, value in enumerate(values):
-        interpolated_stds = []
-        reference_stds = []
-        for item in standards:
-            interpolated_stds.append(df[f'interpolated_std{item}_{parameter}'].iloc[idx])
-            reference_stds.append(df[f'reference_std{item}_{parameter}'].iloc[idx])
-        combined = [(ref, interp) for ref, interp in zip(reference_stds, interpolated_stds)
-                    if not pd.isna(ref) and not pd.isna(interp)]
-        if len(combined) < 2:
-            df.loc[idx, f'QF x{parameter}_cal'] = False
-            continue
-        combined.sort(key=lambda x: x[0])
-        reference_stds_sorted, interpolated_stds_sorted = zip(*combined)
-        slope, intercept, r, p, std_err = stats.linregress(reference_stds_sorted, interpolated_stds_sorted)
-        if (not np.isfinite([slope, r]).all() # if -inf, inf or nan
-                or r**2 < 0.98): # from Quantitative Chemical Analysis, Daniel C. Harris
-            df.loc[idx, f'QF x{parameter}_cal'] = False
-            continue
-        converted_slope = 1 / slope
-        converted_intercept = (intercept * -1) / slope
-        df.loc[idx, f'x{parameter}_cal'] = values.loc[idx] * converted_slope + converted_intercept
-        df.loc[idx, f'standard_slope_{parameter}'] = slope
-        df.loc[idx, f'standard_intercept_{parameter}'] = intercept
-        df.loc[idx, f'standard_r_square_{parameter}'] = r**2
-        df.loc[idx, f'number_of_standards_{parameter}'] = len(reference_stds_sorted)
-        for ref, interp in zip(reference_stds_sorted, interpolated_stds_sorted):
-            df.loc[idx, f'QF x{parameter}_cal'] &= abs(ref - interp) <= standard_threshold
-    df.loc[is_avg, f'QF x{parameter}_cal'] &= (df.loc[is_avg, f'QF {parameter_upper} avg {unit}'] &
-                                          ((df.loc[is_avg, f'x{parameter}_cal'] -
-                                            df.loc[is_avg, f'{parameter_upper} avg {unit}']).abs() <= calibration_threshold))
-
-    df.loc[is_not_avg, f'QF x{parameter}_cal'] &= (df.loc[is_not_avg, f'QF {parameter_upper} {unit}'] &
-                                          ((df.loc[is_not_avg, f'x{parameter}_cal'] -
-                                            df.loc[is_not_avg, f'{parameter_upper} {unit}']).abs() <= calibration_threshold))
+    calibration = calibrate(parameter, unit, df, standards, start_time, prepared)
+    fit = calibration['fit']
+    is_fit = fit['is_fit']
+    df[f'x{parameter}_cal'] = calibration['cal']
+    if expand_coefficients:
+        df[f'standard_slope_{parameter}'] = np.where(is_fit, fit['slope'], np.nan)
+        df[f'standard_intercept_{parameter}'] = np.where(is_fit, fit['intercept'], np.nan)
+        df[f'standard_r_square_{parameter}'] = np.where(is_fit, fit['r_square'], np.nan)
+        df[f'number_of_standards_{parameter}'] = np.where(is_fit, fit['number_of_standards'], np.nan)
+    df[f'QF x{parameter}_cal'] = (is_fit & (fit['max_deviation'] <= standard_threshold) & calibration['qf_measured'] &
+                                  (calibration['calibration_deviation'] <= calibration_threshold))
     return df
 
 
-def calculate_pco2_dry(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pd.DataFrame:
-    df = get_p_equ_p_atm(df)
-    df['pco2_dry'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'pco2_dry'] = (df.loc[df['is_equ'] & is_valid_equ, 'xco2_cal'] *
-                                                       df.loc[df['is_equ'] & is_valid_equ, 'P_equ'])
-    df.loc[df['is_atm'] & is_valid_atm, 'pco2_dry'] = (df.loc[df['is_atm'] & is_valid_atm, 'xco2_cal'] *
-                                                       df.loc[df['is_atm'] & is_valid_atm, 'P_atm_sea'])
-    return df
+#  method to evaluate a grid of calibration and standard thresholds with one calibration. For every pair of thresholds
+#  the number of rows that would get QF x{parameter}_cal True is counted, in total and for equ and atm rows. Each row
+#  is binned once on the smallest thresholds it passes, the counts follow from cumulative sums over the grid.
+def sweep_calibration_thresholds(parameter: str,
+                                 unit: str,
+                                 df: pd.DataFrame,
+                                 standards: list,
+                                 start_time: datetime,
+                                 calibration_thresholds: list = (2, 4, 5, 10, 15, 20, 30),
+                                 standard_thresholds: list = (2, 4, 5, 10, 15, 20, 30),
+                                 prepared: PreparedStandards = None) -> pd.DataFrame:
+    calibration = calibrate(parameter, unit, df, standards, start_time, prepared)
+    fit = calibration['fit']
+    calibration_thresholds = np.sort(np.asarray(calibration_thresholds, dtype=float))
+    standard_thresholds = np.sort(np.asarray(standard_thresholds, dtype=float))
+
+    with np.errstate(invalid='ignore'):
+        rows = np.flatnonzero(fit['is_fit'] & calibration['qf_measured'] &
+                              (calibration['calibration_deviation'] <= calibration_thresholds[-1]) &
+                              (fit['max_deviation'] <= standard_thresholds[-1]))
+    calibration_bin = np.searchsorted(calibration_thresholds, calibration['calibration_deviation'][rows], 'left')
+    standard_bin = np.searchsorted(standard_thresholds, fit['max_deviation'][rows], 'left')
+    shape = (len(calibration_thresholds), len(standard_thresholds))
+
+    counts = {}
+    for name, mask in [('retained', np.ones(len(rows), dtype=bool)),
+                       ('retained equ', get_flag(df, 'is_equ').to_numpy()[rows]),
+                       ('retained atm', get_flag(df, 'is_atm').to_numpy()[rows])]:
+        grid = np.bincount(calibration_bin[mask] * shape[1] + standard_bin[mask],
+                           minlength=shape[0] * shape[1]).reshape(shape)
+        counts[name] = grid.cumsum(axis=0).cumsum(axis=1).ravel()
+
+    calibration_grid, standard_grid = np.meshgrid(calibration_thresholds, standard_thresholds, indexing='ij')
+    df_sweep = pd.DataFrame({
+        'calibration_threshold': calibration_grid.ravel(),
+        'standard_threshold': standard_grid.ravel(),
+        **counts,
+    })
+    df_sweep['retained fraction'] = df_sweep['retained'] / max(int(fit['is_fit'].sum()), 1)
+    return df_sweep
+
+
+def calculate_pco2_dry(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series,
+                       pressures: dict = None) -> pd.DataFrame:
+    df = get_p_equ_p_atm(df, pressures)
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    atm_rows = mask_indices(get_flag(df, 'is_atm') & is_valid_atm)
+    xco2_equ, p_equ = gather(df, ['xco2_cal', 'P_equ'], equ_rows)
+    xco2_atm, p_atm = gather(df, ['xco2_cal', 'P_atm_sea'], atm_rows)
+    return scatter(df, 'pco2_dry', [(equ_rows, xco2_equ * p_equ), (atm_rows, xco2_atm * p_atm)])
 
 
 def calculate_ph2o(temperature_c, salinity):
@@ -162,27 +246,21 @@ def calculate_ph2o(temperature_c, salinity):
 
 
 def calculate_ph2o_equ_atm(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pd.DataFrame:
-    df['ph2o'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'ph2o'] = calculate_ph2o(df.loc[df['is_equ'] & is_valid_equ, 'equ temp'],
-                                                                 df.loc[df['is_equ'] & is_valid_equ, 'SSS'])
-    df.loc[df['is_atm'] & is_valid_atm, 'ph2o'] = calculate_ph2o(df.loc[df['is_atm'] & is_valid_atm, 'SST'],
-                                                                 df.loc[df['is_atm'] & is_valid_atm, 'SSS'])
-    return df
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    atm_rows = mask_indices(get_flag(df, 'is_atm') & is_valid_atm)
+    equ_temp, sss_equ = gather(df, ['equ temp', 'SSS'], equ_rows)
+    sst, sss_atm = gather(df, ['SST', 'SSS'], atm_rows)
+    return scatter(df, 'ph2o', [(equ_rows, calculate_ph2o(equ_temp, sss_equ)), (atm_rows, calculate_ph2o(sst, sss_atm))])
 
 
 def calculate_pco2_wet(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pd.DataFrame:
-    df['pco2_wet'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'pco2_wet'] = \
-        (df.loc[df['is_equ'] & is_valid_equ, 'xco2_cal'] *
-         (df.loc[df['is_equ'] & is_valid_equ, 'P_equ'] -
-          df.loc[df['is_equ'] & is_valid_equ, 'ph2o']))
-    df.loc[df['is_atm'] & is_valid_atm, 'pco2_wet'] = \
-        (df.loc[df['is_atm'] & is_valid_atm, 'xco2_cal'] *
-         (df.loc[df['is_atm'] & is_valid_atm, 'P_atm_sea'] -
-          df.loc[df['is_atm'] & is_valid_atm, 'ph2o']))
-    df['pco2_wet_atm'] = np.nan
-    df.loc[df['is_atm'] & is_valid_atm, 'pco2_wet_atm'] = df.loc[df['is_atm'] & is_valid_atm, 'pco2_wet']
-    return df
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    atm_rows = mask_indices(get_flag(df, 'is_atm') & is_valid_atm)
+    xco2_equ, p_equ, ph2o_equ = gather(df, ['xco2_cal', 'P_equ', 'ph2o'], equ_rows)
+    xco2_atm, p_atm, ph2o_atm = gather(df, ['xco2_cal', 'P_atm_sea', 'ph2o'], atm_rows)
+    pco2_wet_atm = xco2_atm * (p_atm - ph2o_atm)
+    df = scatter(df, 'pco2_wet', [(equ_rows, xco2_equ * (p_equ - ph2o_equ)), (atm_rows, pco2_wet_atm)])
+    return scatter(df, 'pco2_wet_atm', [(atm_rows, pco2_wet_atm)])
 
 
 def calculate_fco2(temperature_c, pressure, pco2_wet, xco2_cal):
@@ -197,60 +275,41 @@ def calculate_fco2(temperature_c, pressure, pco2_wet, xco2_cal):
 
 
 def calculate_fco2_wet(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pd.DataFrame:
-    df['fco2_wet'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'fco2_wet'] = calculate_fco2(df.loc[df['is_equ'] & is_valid_equ, 'equ temp'],
-                                                                     df.loc[df['is_equ'] & is_valid_equ, 'P_equ'],
-                                                                     df.loc[df['is_equ'] & is_valid_equ, 'pco2_wet'],
-                                                                     df.loc[df['is_equ'] & is_valid_equ, 'xco2_cal'])
-    df.loc[df['is_atm'] & is_valid_atm, 'fco2_wet'] = calculate_fco2(df.loc[df['is_atm'] & is_valid_atm, 'SST'],
-                                                                     df.loc[df['is_atm'] & is_valid_atm, 'P_atm_sea'],
-                                                                     df.loc[df['is_atm'] & is_valid_atm, 'pco2_wet'],
-                                                                     df.loc[df['is_atm'] & is_valid_atm, 'xco2_cal'])
-    df['fco2_wet_atm'] = np.nan
-    df.loc[df['is_atm'] & is_valid_atm, 'fco2_wet_atm'] = df.loc[df['is_atm'] & is_valid_atm, 'fco2_wet']
-    return df
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    atm_rows = mask_indices(get_flag(df, 'is_atm') & is_valid_atm)
+    fco2_equ = calculate_fco2(*gather(df, ['equ temp', 'P_equ', 'pco2_wet', 'xco2_cal'], equ_rows))
+    fco2_atm = calculate_fco2(*gather(df, ['SST', 'P_atm_sea', 'pco2_wet', 'xco2_cal'], atm_rows))
+    df = scatter(df, 'fco2_wet', [(equ_rows, fco2_equ), (atm_rows, fco2_atm)])
+    return scatter(df, 'fco2_wet_atm', [(atm_rows, fco2_atm)])
 
 
 def calculate_pco2_fco2_in_situ(df: pd.DataFrame, is_valid_equ: pd.Series) -> pd.DataFrame:
-    df['pco2_wet_sst'] = np.nan
-    df['fco2_wet_sst'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'pco2_wet_sst'] = \
-        (df.loc[df['is_equ'] & is_valid_equ, 'pco2_wet'] *
-         np.exp(0.0423 * (df.loc[df['is_equ'] & is_valid_equ, 'SST'] -
-                          df.loc[df['is_equ'] & is_valid_equ, 'equ temp'])))
-    df.loc[df['is_equ'], 'fco2_wet_sst'] = \
-        (df.loc[df['is_equ'] & is_valid_equ, 'fco2_wet'] *
-         np.exp(0.0423 * (df.loc[df['is_equ'] & is_valid_equ, 'SST'] -
-                          df.loc[df['is_equ'] & is_valid_equ, 'equ temp'])))
-
-    return df
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    pco2_wet, fco2_wet, sst, equ_temp = gather(df, ['pco2_wet', 'fco2_wet', 'SST', 'equ temp'], equ_rows)
+    df = scatter(df, 'pco2_wet_sst', [(equ_rows, pco2_wet * np.exp(0.0423 * (sst - equ_temp)))])
+    return scatter(df, 'fco2_wet_sst', [(equ_rows, fco2_wet * np.exp(0.0423 * (sst - equ_temp)))])
 
 
-def calculate_pch4_dry(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pd.DataFrame:
+def calculate_pch4_dry(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series,
+                       pressures: dict = None) -> pd.DataFrame:
     # Note xCH4 is given as ppb, the resulting unit will be natm
-    df = get_p_equ_p_atm(df)
-    df['pch4_dry'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'pch4_dry'] = (df.loc[df['is_equ'] & is_valid_equ, 'xch4_cal'] *
-                                                       df.loc[df['is_equ'] & is_valid_equ, 'P_equ'])
-    df.loc[df['is_atm'] & is_valid_atm, 'pch4_dry'] = (df.loc[df['is_atm'] & is_valid_atm, 'xch4_cal'] *
-                                                       df.loc[df['is_atm'] & is_valid_atm, 'P_atm_sea'])
-    return df
+    df = get_p_equ_p_atm(df, pressures)
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    atm_rows = mask_indices(get_flag(df, 'is_atm') & is_valid_atm)
+    xch4_equ, p_equ = gather(df, ['xch4_cal', 'P_equ'], equ_rows)
+    xch4_atm, p_atm = gather(df, ['xch4_cal', 'P_atm_sea'], atm_rows)
+    return scatter(df, 'pch4_dry', [(equ_rows, xch4_equ * p_equ), (atm_rows, xch4_atm * p_atm)])
 
 
 def calculate_pch4_wet(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pd.DataFrame:
     # Note xCH4 is given as ppb, the resulting unit will be natm
-    df['pch4_wet'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'pch4_wet'] = \
-        (df.loc[df['is_equ'] & is_valid_equ, 'xch4_cal'] *
-         (df.loc[df['is_equ'] & is_valid_equ, 'P_equ'] -
-          df.loc[df['is_equ'] & is_valid_equ, 'ph2o']))
-    df.loc[df['is_atm'] & is_valid_atm, 'pch4_wet'] = \
-        (df.loc[df['is_atm'] & is_valid_atm, 'xch4_cal'] *
-         (df.loc[df['is_atm'] & is_valid_atm, 'P_atm_sea'] -
-          df.loc[df['is_atm'] & is_valid_atm, 'ph2o']))
-    df['pch4_wet_atm'] = np.nan
-    df.loc[df['is_atm'] & is_valid_atm, 'pch4_wet_atm'] = df.loc[df['is_atm'] & is_valid_atm, 'pch4_wet']
-    return df
+    equ_rows = mask_indices(get_flag(df, 'is_equ') & is_valid_equ)
+    atm_rows = mask_indices(get_flag(df, 'is_atm') & is_valid_atm)
+    xch4_equ, p_equ, ph2o_equ = gather(df, ['xch4_cal', 'P_equ', 'ph2o'], equ_rows)
+    xch4_atm, p_atm, ph2o_atm = gather(df, ['xch4_cal', 'P_atm_sea', 'ph2o'], atm_rows)
+    pch4_wet_atm = xch4_atm * (p_atm - ph2o_atm)
+    df = scatter(df, 'pch4_wet', [(equ_rows, xch4_equ * (p_equ - ph2o_equ)), (atm_rows, pch4_wet_atm)])
+    return scatter(df, 'pch4_wet_atm', [(atm_rows, pch4_wet_atm)])
 
 
 def calculate_bunsen_solubility_coefficient(
@@ -316,41 +375,19 @@ def calculate_ch4_nmol_kg_and_pch4_in_situ(df: pd.DataFrame, is_valid_equ: pd.Se
     # Molar volume for an ideal gas at 1 atm (101.325 kPa) from NIST:
     Vm = 22.41396954 # L mol-1
 
-    # Bunsen coefficient equ chamber
-    beta_equ = calculate_bunsen_solubility_coefficient(
-        df.loc[is_valid_equ, 'equ temp'],
-        df.loc[is_valid_equ, 'SSS']
-    )
+    # the concentration is calculated for all valid rows, pch4 in situ only for the equ rows among them
+    rows = mask_indices(is_valid_equ)
+    equ_temp, sst, sss, pch4_wet = gather(df, ['equ temp', 'SST', 'SSS', 'pch4_wet'], rows)
 
-    # Seawater density at 1 atm in equilibrator
-    dens_equ = seawater_density_at_1_atm(
-        df.loc[is_valid_equ, 'equ temp'],
-        df.loc[is_valid_equ, 'SSS']
-    )
+    # Bunsen coefficient and seawater density at 1 atm in equilibrator
+    beta_equ = calculate_bunsen_solubility_coefficient(equ_temp, sss)
+    dens_equ = seawater_density_at_1_atm(equ_temp, sss)
     # CH4 concentration
-    df['ch4_nmol_kg'] = np.nan
-    df.loc[is_valid_equ, 'ch4_nmol_kg'] = (df.loc[is_valid_equ, 'pch4_wet'] *
-                                           beta_equ / (Vm * dens_equ)
-                                           )
-
-    # Bunsen coefficient in situ
-    beta_in_situ = calculate_bunsen_solubility_coefficient(
-        df.loc[is_valid_equ, 'SST'],
-        df.loc[is_valid_equ, 'SSS']
-    )
-    # Seawater density at 1 atm in situ
-    dens_in_situ = seawater_density_at_1_atm(
-        df.loc[is_valid_equ, 'SST'],
-        df.loc[is_valid_equ, 'SSS']
-    )
-    df['pch4_wet_sst'] = np.nan
-    df.loc[df['is_equ'] & is_valid_equ, 'pch4_wet_sst'] =  (df.loc[is_valid_equ, 'ch4_nmol_kg'] * dens_in_situ / (
-        beta_in_situ / Vm)
-    )
-
-    return df
-
-
-
-
-
+    ch4_nmol_kg = pch4_wet * beta_equ / (Vm * dens_equ)
+    df = scatter(df, 'ch4_nmol_kg', [(rows, ch4_nmol_kg)])
+
+    # Bunsen coefficient and seawater density at 1 atm in situ
+    is_equ = get_flag(df, 'is_equ').to_numpy()[rows]
+    beta_in_situ = calculate_bunsen_solubility_coefficient(sst[is_equ], sss[is_equ])
+    dens_in_situ = seawater_density_at_1_atm(sst[is_equ], sss[is_equ])
+    return scatter(df, 'pch4_wet_sst', [(rows[is_equ], ch4_nmol_kg[is_equ] * dens_in_situ / (beta_in_situ / Vm))])
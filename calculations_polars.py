@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from calculations import (get_p_equ_p_atm, calculate_ph2o, calculate_fco2, calculate_bunsen_solubility_coefficient,
+                          seawater_density_at_1_atm)
+from compact_frame import get_column
+
+# Molar volume for an ideal gas at 1 atm (101.325 kPa) from NIST:
+VM = 22.41396954  # L mol-1
+
+CO2_COLS = ['ph2o', 'pco2_dry', 'pco2_wet', 'pco2_wet_atm', 'fco2_wet', 'fco2_wet_atm', 'pco2_wet_sst', 'fco2_wet_sst']
+CH4_COLS = ['pch4_dry', 'pch4_wet', 'pch4_wet_atm', 'ch4_nmol_kg', 'pch4_wet_sst']
+
+
+#  method to get an expression that is then_expr where the equ mask holds, atm_expr where the atm mask holds and null
+#  otherwise. The atm branch is checked first, as it is written last in the pandas chain.
+def equ_atm_expr(equ_mask: pl.Expr, equ_expr: pl.Expr, atm_mask: pl.Expr, atm_expr: pl.Expr) -> pl.Expr:
+    return pl.when(atm_mask).then(atm_expr).when(equ_mask).then(equ_expr).otherwise(None)
+
+
+#  method to get the expression for ph2o of equ and atm rows, with the equilibrator temperature for equ rows and the
+#  sea surface temperature for atm rows
+def ph2o_expr() -> pl.Expr:
+    valid_equ_ph2o = pl.col('is_valid_equ') & pl.col('QF equ temp') & pl.col('QF SSS')
+    valid_atm_ph2o = pl.col('is_valid_atm') & pl.col('QF SSS') & pl.col('QF SST')
+    return equ_atm_expr(pl.col('is_equ') & valid_equ_ph2o, calculate_ph2o(pl.col('equ temp'), pl.col('SSS')),
+                        pl.col('is_atm') & valid_atm_ph2o, calculate_ph2o(pl.col('SST'), pl.col('SSS'))).alias('ph2o')
+
+
+#  method to get a lazy frame with the columns and masks used by the chain
+def get_chain_frame(df: pd.DataFrame, columns: list, is_valid_equ: pd.Series, is_valid_atm: pd.Series) -> pl.LazyFrame:
+    df_chain = pl.from_pandas(pd.DataFrame({col: get_column(df, col).to_numpy() for col in columns}),
+                              nan_to_null=False)
+    return df_chain.lazy().with_columns(
+        pl.Series('is_valid_equ', is_valid_equ.to_numpy(dtype=bool)),
+        pl.Series('is_valid_atm', is_valid_atm.to_numpy(dtype=bool)),
+    )
+
+
+#  method to write the columns of a collected chain back to the pandas frame
+def set_chain_columns(df: pd.DataFrame, df_chain: pl.DataFrame, columns: list) -> pd.DataFrame:
+    for col in columns:
+        df[col] = df_chain[col].to_numpy().astype(float)
+    return df
+
+
+#  method to calculate ph2o, pco2 and fco2 for dry and wet air and at in situ temperature in one lazy polars plan.
+#  is_valid_equ and is_valid_atm are the base validity masks, the same masks as the pandas chain in process_data are
+#  derived from them. Gives the same columns as calculate_ph2o_equ_atm, calculate_pco2_dry, calculate_pco2_wet,
+#  calculate_fco2_wet and calculate_pco2_fco2_in_situ. pressures are the pressures of compute_p_equ_p_atm if known.
+def calculate_co2_chain_polars(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series,
+                               pressures: dict = None) -> pd.DataFrame:
+    # keep the column order of the pandas chain, where ph2o is added before the pressures
+    df['ph2o'] = np.nan
+    df = get_p_equ_p_atm(df, pressures)
+    columns = ['is_equ', 'is_atm', 'QF xco2_cal', 'QF equ temp', 'QF SSS', 'QF SST', 'xco2_cal', 'equ temp', 'SST',
+               'SSS', 'P_equ', 'P_atm_sea']
+    is_equ = pl.col('is_equ')
+    is_atm = pl.col('is_atm')
+    valid_equ_dry = pl.col('QF xco2_cal') & pl.col('is_valid_equ')
+    valid_atm_dry = pl.col('QF xco2_cal') & pl.col('is_valid_atm')
+    valid_equ_wet = valid_equ_dry & pl.col('QF equ temp') & pl.col('QF SSS')
+    valid_atm_wet = valid_atm_dry & pl.col('QF SSS') & pl.col('QF SST')
+    valid_equ_sst = valid_equ_wet & pl.col('QF SST')
+
+    df_chain = get_chain_frame(df, columns, is_valid_equ, is_valid_atm).with_columns(
+        ph2o_expr(),
+        equ_atm_expr(is_equ & valid_equ_dry, pl.col('xco2_cal') * pl.col('P_equ'),
+                     is_atm & valid_atm_dry, pl.col('xco2_cal') * pl.col('P_atm_sea')).alias('pco2_dry'),
+    ).with_columns(
+        equ_atm_expr(is_equ & valid_equ_wet, pl.col('xco2_cal') * (pl.col('P_equ') - pl.col('ph2o')),
+                     is_atm & valid_atm_wet, pl.col('xco2_cal') * (pl.col('P_atm_sea') - pl.col('ph2o'))
+                     ).alias('pco2_wet'),
+    ).with_columns(
+        pl.when(is_atm & valid_atm_wet).then(pl.col('pco2_wet')).alias('pco2_wet_atm'),
+        equ_atm_expr(is_equ & valid_equ_wet,
+                     calculate_fco2(pl.col('equ temp'), pl.col('P_equ'), pl.col('pco2_wet'), pl.col('xco2_cal')),
+                     is_atm & valid_atm_wet,
+                     calculate_fco2(pl.col('SST'), pl.col('P_atm_sea'), pl.col('pco2_wet'), pl.col('xco2_cal'))
+                     ).alias('fco2_wet'),
+    ).with_columns(
+        pl.when(is_atm & valid_atm_wet).then(pl.col('fco2_wet')).alias('fco2_wet_atm'),
+        pl.when(is_equ & valid_equ_sst).then(
+            pl.col('pco2_wet') * np.exp(0.0423 * (pl.col('SST') - pl.col('equ temp')))).alias('pco2_wet_sst'),
+        pl.when(is_equ & valid_equ_sst).then(
+            pl.col('fco2_wet') * np.exp(0.0423 * (pl.col('SST') - pl.col('equ temp')))).alias('fco2_wet_sst'),
+    ).collect()
+    return set_chain_columns(df, df_chain, CO2_COLS)
+
+
+#  method to calculate pch4 for dry and wet air, the dissolved ch4 concentration and pch4 at in situ temperature in one
+#  lazy polars plan, using the ph2o column of the co2 chain or, without it, calculating ph2o in the plan. Gives the
+#  same columns as calculate_pch4_dry, calculate_pch4_wet and calculate_ch4_nmol_kg_and_pch4_in_situ. As in the pandas
+#  chain the concentration is calculated for all valid rows, also atm rows, while pch4 at in situ temperature is only
+#  kept for equ rows. pressures as in calculate_co2_chain_polars.
+def calculate_ch4_chain_polars(df: pd.DataFrame, is_valid_equ: pd.Series, is_valid_atm: pd.Series,
+                               pressures: dict = None) -> pd.DataFrame:
+    df = get_p_equ_p_atm(df, pressures)
+    columns = ['is_equ', 'is_atm', 'QF xch4_cal', 'QF equ temp', 'QF SSS', 'QF SST', 'xch4_cal', 'equ temp', 'SST',
+               'SSS', 'P_equ', 'P_atm_sea']
+    has_ph2o = 'ph2o' in df.columns
+    if has_ph2o:
+        columns.append('ph2o')
+    is_equ = pl.col('is_equ')
+    is_atm = pl.col('is_atm')
+    valid_equ_dry = pl.col('QF xch4_cal') & pl.col('is_valid_equ')
+    valid_atm_dry = pl.col('QF xch4_cal') & pl.col('is_valid_atm')
+    valid_equ_wet = valid_equ_dry & pl.col('QF equ temp') & pl.col('QF SSS')
+    valid_atm_wet = valid_atm_dry & pl.col('QF SSS') & pl.col('QF SST')
+    valid_sst = valid_equ_wet & pl.col('QF SST')
+
+    df_chain = get_chain_frame(df, columns, is_valid_equ, is_valid_atm)
+    if not has_ph2o:
+        df_chain = df_chain.with_columns(ph2o_expr())
+    df_chain = df_chain.with_columns(
+        equ_atm_expr(is_equ & valid_equ_dry, pl.col('xch4_cal') * pl.col('P_equ'),
+                     is_atm & valid_atm_dry, pl.col('xch4_cal') * pl.col('P_atm_sea')).alias('pch4_dry'),
+        equ_atm_expr(is_equ & valid_equ_wet, pl.col('xch4_cal') * (pl.col('P_equ') - pl.col('ph2o')),
+                     is_atm & valid_atm_wet, pl.col('xch4_cal') * (pl.col('P_atm_sea') - pl.col('ph2o'))
+                     ).alias('pch4_wet'),
+    ).with_columns(
+        pl.when(is_atm & valid_atm_wet).then(pl.col('pch4_wet')).alias('pch4_wet_atm'),
+        pl.when(valid_sst).then(
+            pl.col('pch4_wet') * calculate_bunsen_solubility_coefficient(pl.col('equ temp'), pl.col('SSS')) /
+            (VM * seawater_density_at_1_atm(pl.col('equ temp'), pl.col('SSS')))).alias('ch4_nmol_kg'),
+    ).with_columns(
+        pl.when(is_equ & valid_sst).then(
+            pl.col('ch4_nmol_kg') * seawater_density_at_1_atm(pl.col('SST'), pl.col('SSS')) /
+            (calculate_bunsen_solubility_coefficient(pl.col('SST'), pl.col('SSS')) / VM)).alias('pch4_wet_sst'),
+    ).collect()
+    return set_chain_columns(df, df_chain, CH4_COLS)
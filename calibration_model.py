@@ -0,0 +1,175 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from calculations import get_calibration_standards, fit_standards
+from compact_frame import get_flag
+from prepare_standards import PreparedStandards, get_standard_runs
+
+# how the value of a standard continues from a knot until the next knot
+KNOT_NAN = 0
+KNOT_HOLD = 1
+KNOT_LINEAR = 2
+
+
+#  method to describe the interpolated values of a standard as knots in elapsed time. Each run holds its median, the
+#  gap after a run is interpolated to the next run when both use the same reference, holds the median for at most 12
+#  hours when the gap is longer than 12 hours and holds the median until the next run otherwise. These are the rules
+#  of get_median_and_interpolate, so evaluating the knots gives the same values for the rows of df as long as their
+#  elapsed times are unique. Rows sharing a time stamp on both sides of a run boundary have different per row values
+#  but get one value from the knots. before and after are optional (elapsed time, median, reference) anchors of runs
+#  outside the rows, as for prepare_standards.interpolate_gaps.
+def get_standard_knots(elapsed: np.ndarray, is_std: np.ndarray, medians: np.ndarray, references: np.ndarray,
+                       before: tuple = None, after: tuple = None):
+    starts, ends = get_standard_runs(is_std)
+    # start and end time, median and start and end reference of every run, borrowed anchors are runs of one time
+    runs = [(elapsed[start], elapsed[end - 1], medians[start], references[start], references[end - 1])
+            for start, end in zip(starts, ends)]
+    if before is not None:
+        runs.insert(0, (before[0], before[0], before[1], before[2], before[2]))
+    if after is not None:
+        runs.append((after[0], after[0], after[1], after[2], after[2]))
+
+    times, values, modes = [], [], []
+    for i, (t_start, t_end, median, _, reference_end) in enumerate(runs):
+        times.append(t_start)
+        values.append(median)
+        modes.append(KNOT_HOLD)
+        if i == len(runs) - 1:
+            times.append(np.nextafter(t_end, np.inf))
+            values.append(np.nan)
+            modes.append(KNOT_NAN)
+            continue
+        next_start, _, _, next_reference, _ = runs[i + 1]
+        if next_start - t_end > 12 * 3600:
+            times.append(np.nextafter(t_end + 12 * 3600, np.inf))
+            values.append(np.nan)
+            modes.append(KNOT_NAN)
+        elif next_reference == reference_end:
+            if t_end > t_start:
+                times.append(t_end)
+                values.append(median)
+                modes.append(KNOT_LINEAR)
+            else:
+                modes[-1] = KNOT_LINEAR
+    return np.asarray(times, dtype=float), np.asarray(values, dtype=float), np.asarray(modes, dtype=np.int8)
+
+
+#  method to evaluate knots at elapsed times
+def evaluate_knots(times: np.ndarray, values: np.ndarray, modes: np.ndarray, elapsed: np.ndarray) -> np.ndarray:
+    result = np.full(len(elapsed), np.nan)
+    if len(times) == 0:
+        return result
+    idx = np.searchsorted(times, elapsed, 'right') - 1
+    is_known = idx >= 0
+    mode = np.where(is_known, modes[np.maximum(idx, 0)], KNOT_NAN)
+    is_hold = mode == KNOT_HOLD
+    result[is_hold] = values[idx[is_hold]]
+    is_linear = mode == KNOT_LINEAR
+    result[is_linear] = np.interp(elapsed[is_linear], times, values)
+    return result
+
+
+#  method to describe a per row step function, such as the reference value of a standard, as change points
+def get_steps(elapsed: np.ndarray, values: np.ndarray):
+    is_change = np.ones(len(values), dtype=bool)
+    is_change[1:] = ~((values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1])))
+    return elapsed[is_change].astype(float), values[is_change]
+
+
+#  method to evaluate a step function at elapsed times, NaN before the first step
+def evaluate_steps(times: np.ndarray, values: np.ndarray, elapsed: np.ndarray) -> np.ndarray:
+    idx = np.searchsorted(times, elapsed, 'right') - 1
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], np.nan) if len(times) else np.full(len(elapsed), np.nan)
+
+
+#  calibration of one gas by the standards. For every standard the interpolated value is kept as knots and the
+#  reference value as steps, both on elapsed time (s) counted from origin. The model holds no fitted coefficients:
+#  the standards are looked up with searchsorted and fitted in closed form for every time the model is evaluated at,
+#  which gives the same calibration as correct_based_on_standards without per row standard columns, for frames
+#  without duplicated time stamps (see get_standard_knots). The model is built per run and is not saved.
+@dataclass
+class CalibrationModel:
+    parameter: str
+    unit: str
+    origin: datetime
+    standards: list
+    knots: dict = field(default_factory=dict)
+    references: dict = field(default_factory=dict)
+
+    #  method to get elapsed time (s) since origin, counted as for the GO frames
+    def get_elapsed(self, times) -> np.ndarray:
+        return np.trunc((pd.to_datetime(pd.Series(times)) - pd.Timestamp(self.origin)).dt.total_seconds().to_numpy())
+
+    #  method to get the reference and interpolated values of the standards as (rows x standards) arrays
+    def get_standard_matrices(self, elapsed: np.ndarray):
+        elapsed = np.asarray(elapsed, dtype=float)
+        if not self.standards:
+            return np.empty((len(elapsed), 0)), np.empty((len(elapsed), 0))
+        references = np.column_stack([evaluate_steps(*self.references[item], elapsed) for item in self.standards])
+        interpolated = np.column_stack([evaluate_knots(*self.knots[item], elapsed) for item in self.standards])
+        return references, interpolated
+
+    #  method to calibrate measured values at elapsed times, returns the fit and the calibrated values
+    def apply(self, elapsed: np.ndarray, values: np.ndarray) -> dict:
+        fit = fit_standards(*self.get_standard_matrices(elapsed))
+        is_fit = fit['is_fit']
+        cal = np.full(len(values), np.nan)
+        cal[is_fit] = (np.asarray(values, dtype=float)[is_fit] * (1 / fit['slope'][is_fit]) +
+                       (fit['intercept'][is_fit] * -1) / fit['slope'][is_fit])
+        return {'fit': fit, 'cal': cal}
+
+    #  method to get the times where the calibration changes behaviour, the start of each calibration segment
+    def get_segment_times(self) -> np.ndarray:
+        times = [self.knots[item][0] for item in self.standards] + [self.references[item][0]
+                                                                    for item in self.standards]
+        return np.unique(np.concatenate(times)) if times else np.empty(0)
+
+    #  method to get the fitted coefficients at the start of each calibration segment, with the columns of the per row
+    #  coefficients, so that the table can be plotted with plot_intercept_slope. The coefficients change along linearly
+    #  interpolated segments, so the table samples them at the segment starts and does not hold every row.
+    def get_coefficient_table(self) -> pd.DataFrame:
+        elapsed = self.get_segment_times()
+        fit = fit_standards(*self.get_standard_matrices(elapsed))
+        is_fit = fit['is_fit']
+        return pd.DataFrame({
+            'time series': pd.Timestamp(self.origin) + pd.to_timedelta(elapsed, unit='s'),
+            'elapsed time (s)': elapsed,
+            f'standard_slope_{self.parameter}': np.where(is_fit, fit['slope'], np.nan),
+            f'standard_intercept_{self.parameter}': np.where(is_fit, fit['intercept'], np.nan),
+            f'standard_r_square_{self.parameter}': np.where(is_fit, fit['r_square'], np.nan),
+            f'number_of_standards_{self.parameter}': np.where(is_fit, fit['number_of_standards'], np.nan),
+        })
+
+    #  method to write the per row coefficient columns of correct_based_on_standards for the rows of df
+    def expand(self, df: pd.DataFrame) -> pd.DataFrame:
+        fit = fit_standards(*self.get_standard_matrices(df['elapsed time (s)'].to_numpy(dtype=float)))
+        is_fit = fit['is_fit']
+        df[f'standard_slope_{self.parameter}'] = np.where(is_fit, fit['slope'], np.nan)
+        df[f'standard_intercept_{self.parameter}'] = np.where(is_fit, fit['intercept'], np.nan)
+        df[f'standard_r_square_{self.parameter}'] = np.where(is_fit, fit['r_square'], np.nan)
+        df[f'number_of_standards_{self.parameter}'] = np.where(is_fit, fit['number_of_standards'], np.nan)
+        return df
+
+
+#  method to build the calibration model of a gas from the standard columns of df, after get_standard_reference_value
+#  and get_median_and_interpolate, or with the medians of prepared. anchors are the borrowed runs passed to
+#  prepare_standards.prepare_all_standards, {standard: {gas: (before, after)}}.
+def build_calibration_model(parameter: str, unit: str, df: pd.DataFrame, standards: list,
+                            start_time: datetime, prepared: PreparedStandards = None,
+                            anchors: dict = None) -> CalibrationModel:
+    parameter = parameter.lower()
+    elapsed = df['elapsed time (s)'].to_numpy(dtype=float)
+    origin = (pd.Timestamp(df['time series'].iloc[0]) - pd.to_timedelta(elapsed[0], unit='s')).to_pydatetime()
+    model = CalibrationModel(parameter, unit, origin, get_calibration_standards(standards, start_time))
+    for item in model.standards:
+        references = df[f'reference_std{item}_{parameter}'].to_numpy(dtype=float)
+        medians = (df[f'median_std{item}_{parameter}'].to_numpy(dtype=float) if prepared is None
+                   else prepared.get_medians(parameter, item))
+        before, after = (anchors or {}).get(item, {}).get(parameter, (None, None))
+        model.knots[item] = get_standard_knots(elapsed, get_flag(df, f'is_std{item}').to_numpy(), medians, references,
+                                               before, after)
+        model.references[item] = get_steps(elapsed, references)
+    return model
@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+
+# housekeeping channels only used by the quality checks and the plots, stored as float32 in a compact frame. Time
+# like columns, 'elapsed time (s)' and 'LI7810_SECONDS', are kept as float64: a year of seconds does not fit the 24 bit
+# mantissa of float32.
+HOUSEKEEPING_COLS = ['CO2 std ppm', 'CH4 std ppb', 'H2O ppt', 'H2O avg ppt', 'H2O std ppt', 'licor temp', 'H2O flow',
+                     'licor flow', 'equ pump', 'vent flow', 'atm cond', 'equ cond', 'drip 1', 'cond temp',
+                     'dry box temp', 'Lat', 'Lon', 'SBE38', 'SBE45 Salinity', 'atm pressure', 'ALICAT press', 'CDOM',
+                     'Phycocyanin', 'O2', 'Chl_fluorescense', 'Turbidity', 'delta temperature', 'QF Latitude',
+                     'QF Longitude']
+
+# string columns with few distinct values (at most one per second of the day for the times), stored as categoricals
+# in a compact frame
+CATEGORY_COLS = ['Type', 'error', 'PC Date', 'PC Time', 'GPS Date', 'GPS Time']
+
+FLAG_PREFIXES = ('QF ', 'is_')
+FLAG_WORD_BITS = 64
+
+
+#  method to check if a column is a boolean flag that can be packed
+def is_flag_column(df: pd.DataFrame, col: str):
+    return col.startswith(FLAG_PREFIXES) and df[col].dtype == bool
+
+
+#  method to pack boolean flag columns into uint64 bitset columns ('flags 0', 'flags 1', ...). The bit of each flag is
+#  kept in df.attrs['flag_bits'], flags packed earlier keep their bits. Without names all QF and is_ boolean columns
+#  are packed.
+def pack_flags(df: pd.DataFrame, names: list = None) -> pd.DataFrame:
+    flag_bits = dict(df.attrs.get('flag_bits', {}))
+    if names is None:
+        names = [col for col in df.columns if is_flag_column(df, col)]
+    names = [name for name in names if name not in flag_bits]
+    if not names:
+        return df
+    words = {}
+    for name in names:
+        position = len(flag_bits)
+        word_col = f'flags {position // FLAG_WORD_BITS}'
+        if word_col not in words:
+            words[word_col] = (df[word_col].to_numpy().copy() if word_col in df.columns
+                               else np.zeros(len(df), dtype=np.uint64))
+        bit = position % FLAG_WORD_BITS
+        words[word_col] |= df[name].to_numpy(dtype=bool).astype(np.uint64) << np.uint64(bit)
+        flag_bits[name] = (word_col, bit)
+    df = df.drop(columns=names)
+    for word_col, values in words.items():
+        df[word_col] = values
+    df.attrs['flag_bits'] = flag_bits
+    return df
+
+
+#  method to get a column of a frame, unpacking it from the bitset if it is a packed flag
+def get_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    flag_bits = df.attrs.get('flag_bits', {})
+    if name not in flag_bits:
+        raise KeyError(name)
+    word_col, bit = flag_bits[name]
+    values = (df[word_col].to_numpy() >> np.uint64(bit)) & np.uint64(1)
+    return pd.Series(values.astype(bool), index=df.index, name=name)
+
+
+#  method to get a boolean flag, from its own column or from the bitset
+def get_flag(df: pd.DataFrame, name: str) -> pd.Series:
+    return get_column(df, name).astype(bool)
+
+
+#  method to get the combination (and) of several flags. Packed flags are tested with one mask per bitset column,
+#  flags that are plain columns are combined as usual.
+def combine_flags(df: pd.DataFrame, names: list) -> pd.Series:
+    flag_bits = df.attrs.get('flag_bits', {})
+    combined = np.ones(len(df), dtype=bool)
+    masks = {}
+    for name in names:
+        if name not in df.columns and name in flag_bits:
+            word_col, bit = flag_bits[name]
+            masks[word_col] = masks.get(word_col, np.uint64(0)) | (np.uint64(1) << np.uint64(bit))
+        else:
+            combined &= get_flag(df, name).to_numpy()
+    for word_col, mask in masks.items():
+        combined &= (df[word_col].to_numpy() & mask) == mask
+    return pd.Series(combined, index=df.index)
+
+
+#  method to unpack all packed flags back into boolean columns
+def expand_flags(df: pd.DataFrame) -> pd.DataFrame:
+    flag_bits = df.attrs.get('flag_bits', {})
+    if not flag_bits:
+        return df
+    flags = {name: get_flag(df, name) for name in flag_bits}
+    word_cols = sorted({word_col for word_col, _ in flag_bits.values()})
+    df = pd.concat([df.drop(columns=word_cols), pd.DataFrame(flags, index=df.index)], axis=1)
+    df.attrs = {key: value for key, value in df.attrs.items() if key != 'flag_bits'}
+    return df
+
+
+#  method to make the working frame smaller: Type and other repeating strings as categoricals, the boolean QF and is_
+#  flags packed into bitset columns and, optionally, the housekeeping channels as float32. The returned frame is a
+#  consolidated copy.
+def compact_frame(df: pd.DataFrame, housekeeping_float32: bool = True) -> pd.DataFrame:
+    for col in CATEGORY_COLS:
+        if col in df.columns and df[col].dtype == object:
+            df[col] = df[col].astype('category')
+    if housekeeping_float32:
+        for col in HOUSEKEEPING_COLS:
+            if col in df.columns and df[col].dtype == np.float64:
+                df[col] = df[col].astype(np.float32)
+    return pack_flags(df).copy()
@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+
+#  method to turn a boolean mask into the integer positions of the rows where it holds
+def mask_indices(mask) -> np.ndarray:
+    return np.flatnonzero(np.asarray(mask, dtype=bool))
+
+
+#  method to gather columns at the given row positions into contiguous float arrays, in the order of columns
+def gather(df: pd.DataFrame, columns: list, rows: np.ndarray) -> list:
+    return [df[col].to_numpy(dtype=float)[rows] for col in columns]
+
+
+#  method to write a new float column in one go, NaN except at the rows of each (rows, values) part. Parts are written
+#  in order, so a later part wins where rows overlap, as with consecutive df.loc assignments.
+def scatter(df: pd.DataFrame, column: str, parts: list) -> pd.DataFrame:
+    values = np.full(len(df), np.nan)
+    for rows, part in parts:
+        values[rows] = part
+    df[column] = values
+    return df
@@ -20,6 +20,20 @@ def get_data_path():
     return data_folder
 
 
+#  method to add the uncertainty percentiles of the exported values, e.g. fco2_wet_sst_p2.5, when they are calculated
+def add_percentile_columns(df: pd.DataFrame, export_columns: list, units: dict, round_columns: list):
+    for col in list(export_columns):
+        for percentile_col in [item for item in df.columns if item.startswith(f'{col}_p')]:
+            export_columns.append(percentile_col)
+            if col == 'ch4_nmol_kg':
+                units[percentile_col.replace('ch4_nmol_kg', 'dissolved_ch4_concentration')] = \
+                    units['dissolved_ch4_concentration']
+            else:
+                units[percentile_col] = units[col]
+            if col in round_columns:
+                round_columns.append(percentile_col)
+
+
 def export_fco2_ch4(
         df: pd.DataFrame,
         start_date: str,
@@ -83,6 +97,7 @@ def export_fco2_ch4(
             'pch4_wet_sst',
             'pch4_wet_atm',
         ])
+        add_percentile_columns(df, export_columns, units, round_columns)
         filtered_df = df.loc[(
             df['fco2_wet_atm'].notna() |
             df['fco2_wet_sst'].notna() |
@@ -90,12 +105,12 @@ def export_fco2_ch4(
             df['ch4_nmol_kg'].notna() |
             df['pch4_wet_atm'].notna()
         ), export_columns]
-        filtered_df = filtered_df.rename(columns={
-            'ch4_nmol_kg': 'dissolved_ch4_concentration'
-        })
-        filtered_df.loc[1:, 'dissolved_ch4_concentration'] = filtered_df.loc[1:, 'dissolved_ch4_concentration'].round(4)
+        filtered_df = filtered_df.rename(columns=lambda col: col.replace('ch4_nmol_kg', 'dissolved_ch4_concentration'))
+        concentration_columns = [col for col in filtered_df.columns if col.startswith('dissolved_ch4_concentration')]
+        filtered_df.loc[1:, concentration_columns] = filtered_df.loc[1:, concentration_columns].round(4)
         filename = f"Tavastland_CO2_CH4_data_{start_date}_to_{end_date}.txt"
     else:
+        add_percentile_columns(df, export_columns, units, round_columns)
         filtered_df = df.loc[(
                 df['fco2_wet_atm'].notna() |
                 df['fco2_wet_sst'].notna()
@@ -114,6 +129,13 @@ def export_fco2_ch4(
     df_to_export.to_csv(export_path, sep='\t', index=False)
     return
 
+def export_threshold_sweep(df_sweep: pd.DataFrame, parameter: str, start_date: str, end_date: str):
+    filename = f"threshold_sweep_{parameter.lower()}_{start_date}_to_{end_date}.txt"
+    export_path = os.path.join(get_data_path(), filename)
+    df_sweep.to_csv(export_path, sep='\t', index=False)
+    return
+
+
 def export_ferrybox_with_fco2_ch4(df: pd.DataFrame, df_fb: pd.DataFrame, start_str: str, end_str: str, has_ch4: bool):
 
     # select co2 and ch4 data to add to ferrybox data
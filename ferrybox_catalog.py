@@ -0,0 +1,104 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import polars as pl
+
+# catalogs already loaded in this process, keyed on catalog path
+_catalogs = {}
+
+
+def get_ferrybox_catalog_path():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "ferrybox_catalog.parquet")
+
+
+def is_ferrybox_file(f: str):
+    return (
+        f.endswith('.txt')
+        and ('Tavastland' in f or 'TransPaper' in f)
+        and ('Region' not in f)
+        and ('OK' in f)
+    )
+
+
+#  method to parse start and end time from a ferrybox file name, returns None if the name can not be parsed
+def parse_ferrybox_file_times(f: str):
+    try:
+        parts = f.split('_')
+        start_time_file = datetime.strptime(parts[2], "%Y%m%d%H%M%S")
+        end_time_file = datetime.strptime(parts[3], "%Y%m%d%H%M%S")
+    except (IndexError, ValueError):
+        return None
+    return start_time_file, end_time_file
+
+
+#  method to build the interval index, files sorted on start time together with the running maximum of end time
+def build_catalog_index(df: pl.DataFrame):
+    df = df.sort('start', 'file')
+    end = df['end'].to_numpy()
+    return {
+        'file': df['file'].to_numpy(),
+        'start': df['start'].to_numpy(),
+        'end': end,
+        'max_end': np.maximum.accumulate(end) if len(end) else end,
+        'frame': df,
+    }
+
+
+#  method to load the persistent catalog of ferrybox files in folder. The directory is only listed again when its
+#  modification time has changed, and then only new file names are parsed.
+def load_ferrybox_catalog(folder: str, catalog_path: str):
+    folder_mtime_ns = os.stat(folder).st_mtime_ns
+    catalog = _catalogs.get(catalog_path)
+    if catalog is not None and catalog['folder'] == folder and catalog['mtime_ns'] == folder_mtime_ns:
+        return catalog
+
+    meta_path = catalog_path + '.json'
+    df = pl.DataFrame(schema={'file': pl.Utf8, 'start': pl.Datetime('us'), 'end': pl.Datetime('us')})
+    meta = {}
+    if os.path.exists(catalog_path) and os.path.exists(meta_path):
+        with open(meta_path, encoding='utf8') as file:
+            meta = json.load(file)
+        if meta.get('folder') == folder:
+            df = pl.read_parquet(catalog_path)
+        else:
+            meta = {}
+
+    if meta.get('mtime_ns') != folder_mtime_ns:
+        names = [f for f in os.listdir(folder) if is_ferrybox_file(f)]
+        known = set(df['file'].to_list())
+        rows = []
+        for f in names:
+            if f in known:
+                continue
+            times = parse_ferrybox_file_times(f)
+            if times is not None:
+                rows.append((f, times[0], times[1]))
+        df = pl.concat([
+            df.filter(pl.col('file').is_in(names)),
+            pl.DataFrame(rows, schema=df.schema, orient='row'),
+        ])
+        df.write_parquet(f'{catalog_path}.{os.getpid()}.tmp')
+        os.replace(f'{catalog_path}.{os.getpid()}.tmp', catalog_path)
+        meta = {'folder': folder, 'mtime_ns': folder_mtime_ns}
+        with open(f'{meta_path}.{os.getpid()}.tmp', 'w', encoding='utf8') as file:
+            json.dump(meta, file)
+        os.replace(f'{meta_path}.{os.getpid()}.tmp', meta_path)
+        print(f'Ferrybox catalog: {len(rows)} new files, {df.height} files in total')
+
+    catalog = build_catalog_index(df)
+    catalog['folder'] = folder
+    catalog['mtime_ns'] = folder_mtime_ns
+    _catalogs[catalog_path] = catalog
+    return catalog
+
+
+#  method to find the files overlapping start_time to end_time with two binary searches in the interval index
+def query_ferrybox_catalog(catalog: dict, start_time: datetime, end_time: datetime):
+    start = np.datetime64(start_time, 'us')
+    end = np.datetime64(end_time, 'us')
+    upper = np.searchsorted(catalog['start'], end, side='right')
+    lower = np.searchsorted(catalog['max_end'], start, side='left')
+    selected = catalog['end'][lower:upper] >= start
+    return [os.path.join(catalog['folder'], f) for f in catalog['file'][lower:upper][selected]]
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import polars as pl
+
+from file_lock import file_lock
+
+# bump when file_reader.normalise_ferrybox changes, so that the store is converted again
+STORE_VERSION = 1
+
+
+def get_ferrybox_store_path():
+    store_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ferrybox_store")
+    os.makedirs(store_folder, exist_ok=True)
+    return store_folder
+
+
+def get_source_name(f: str):
+    return hashlib.sha1(os.path.abspath(f).encode('utf8')).hexdigest()
+
+
+def get_partition_folder(store_folder: str, year: int, month: int):
+    return os.path.join(store_folder, f'year={year}', f'month={month:02d}')
+
+
+#  the store lock is held while the manifest and partition files are updated and while partitions are read, so that
+#  a process reading the store never sees partition files removed or replaced by another process
+def get_store_lock_path(store_folder: str):
+    return os.path.join(store_folder, 'store.lock')
+
+
+def load_store_manifest(store_folder: str):
+    manifest_path = os.path.join(store_folder, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf8') as file:
+        manifest = json.load(file)
+    if manifest.get('version') != STORE_VERSION:
+        return {}
+    return manifest['files']
+
+
+#  method to add updated entries to the manifest on disk, called while holding the store lock
+def save_store_manifest(store_folder: str, updates: dict):
+    manifest = load_store_manifest(store_folder)
+    manifest.update(updates)
+    manifest_path = os.path.join(store_folder, 'manifest.json')
+    tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf8') as file:
+        json.dump({'version': STORE_VERSION, 'files': manifest}, file, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+#  method to convert new or changed ferrybox files into the store. Each source file is read with reader, typed,
+#  deduplicated and QF filtered with normaliser and written as one parquet file per year and month it covers, so a
+#  changed source file only replaces its own partition files. The store lock is held for the whole update, so a
+#  file converted by another process in the meantime is found in the manifest and not converted again.
+def update_ferrybox_store(file_list: list, store_folder: str, reader, normaliser):
+    os.makedirs(store_folder, exist_ok=True)
+    with file_lock(get_store_lock_path(store_folder)):
+        manifest = load_store_manifest(store_folder)
+        updates = {}
+        for f in file_list:
+            path = os.path.abspath(f)
+            stat = os.stat(f)
+            entry = manifest.get(path)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                continue
+
+            source_name = get_source_name(f)
+            if entry is not None:
+                for partition in entry['partitions']:
+                    partition_path = os.path.join(store_folder, partition, f'{source_name}.parquet')
+                    if os.path.exists(partition_path):
+                        os.remove(partition_path)
+
+            df = normaliser(reader(f)).filter(pl.col('Time_series').is_not_null())
+            partitions = []
+            for (year, month), df_month in df.group_by(
+                    pl.col('Time_series').dt.year().alias('year'),
+                    pl.col('Time_series').dt.month().alias('month')):
+                partition_folder = get_partition_folder(store_folder, year, month)
+                os.makedirs(partition_folder, exist_ok=True)
+                partition_path = os.path.join(partition_folder, f'{source_name}.parquet')
+                df_month.sort('Time_series').write_parquet(f'{partition_path}.{os.getpid()}.tmp')
+                os.replace(f'{partition_path}.{os.getpid()}.tmp', partition_path)
+                partitions.append(os.path.relpath(partition_folder, store_folder))
+
+            updates[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'partitions': partitions}
+
+        if updates:
+            save_store_manifest(store_folder, updates)
+    return
+
+
+#  method to read typed ferrybox data for a time range from the store, only the year/month partitions overlapping
+#  the range are read. If file_list is given only data converted from those source files is returned. If no
+#  partition matches an empty frame with the given schema is returned.
+def read_ferrybox_store(store_folder: str, start_time: datetime = None, end_time: datetime = None,
+                        file_list: list = None, schema: dict = None):
+    with file_lock(get_store_lock_path(store_folder)):
+        return scan_ferrybox_store(store_folder, start_time, end_time, file_list, schema)
+
+
+#  method to read the store, see read_ferrybox_store, called while holding the store lock
+def scan_ferrybox_store(store_folder: str, start_time: datetime = None, end_time: datetime = None,
+                        file_list: list = None, schema: dict = None):
+    sources = None if file_list is None else {f'{get_source_name(f)}.parquet' for f in file_list}
+    parquet_files = []
+    for year_folder in sorted(os.listdir(store_folder)):
+        if not year_folder.startswith('year='):
+            continue
+        year = int(year_folder[5:])
+        for month_folder in sorted(os.listdir(os.path.join(store_folder, year_folder))):
+            month = int(month_folder[6:])
+            if start_time is not None and (year, month) < (start_time.year, start_time.month):
+                continue
+            if end_time is not None and (year, month) > (end_time.year, end_time.month):
+                continue
+            partition_folder = os.path.join(store_folder, year_folder, month_folder)
+            parquet_files.extend(
+                os.path.join(partition_folder, name) for name in sorted(os.listdir(partition_folder))
+                if name.endswith('.parquet') and (sources is None or name in sources)
+            )
+
+    if not parquet_files:
+        return pl.DataFrame(schema=schema)
+
+    df = pl.scan_parquet(parquet_files)
+    if start_time is not None:
+        df = df.filter(pl.col('Time_series') >= start_time)
+    if end_time is not None:
+        df = df.filter(pl.col('Time_series') <= end_time)
+    # sources may overlap in time, so duplicates are removed across files
+    return df.unique().sort('Time_series').collect()
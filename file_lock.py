@@ -0,0 +1,35 @@
+import os
+from contextlib import contextmanager
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+
+#  method to hold an exclusive lock on lock_path while the block runs. Other processes taking the same lock wait until
+#  it is released, the lock is released by the operating system if the process dies.
+@contextmanager
+def file_lock(lock_path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    with open(lock_path, 'a+b') as file:
+        if msvcrt is not None:
+            file.seek(0)
+            while True:
+                try:
+                    # LK_LOCK gives up after 10 attempts of one second
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if msvcrt is not None:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+
+import polars as pl
+
+from file_lock import file_lock
+
+# bump when the entries or the containment check change, so that the files are read again
+MANIFEST_VERSION = 1
+
+DATE_COLS = ['PC Date', 'PcDate', 'Date']
+TIME_COLS = ['PC Time', 'PcTime']
+
+
+#  method to split a GO file in header and data lines without parsing it
+def read_lines(f: str):
+    with open(f, 'rb') as file:
+        data = file.read()
+    header, _, body = data.partition(b'\n')
+    return header.rstrip(b'\r'), body
+
+
+#  method to parse the time stamp of a data line, returns None if it can not be parsed
+def parse_line_time(line: bytes, date_idx: int, time_idx: int):
+    values = line.rstrip(b'\r').split(b'\t')
+    try:
+        return datetime.strptime(
+            f"{values[date_idx].decode('utf8').strip()} {values[time_idx].decode('utf8').strip()}",
+            "%d/%m/%y %H:%M:%S")
+    except (IndexError, ValueError, UnicodeDecodeError):
+        return None
+
+
+#  method to get the first and last time stamp of a GO file from its first and last data line
+def get_line_span(header: bytes, body: bytes):
+    columns = [col.lstrip() for col in header.decode('utf8', errors='replace').split('\t')]
+    date_idx = next((columns.index(col) for col in DATE_COLS if col in columns), None)
+    time_idx = next((columns.index(col) for col in TIME_COLS if col in columns), None)
+    lines = [line for line in body.split(b'\n') if line.strip()]
+    if date_idx is None or time_idx is None or not lines:
+        return None, None
+    return parse_line_time(lines[0], date_idx, time_idx), parse_line_time(lines[-1], date_idx, time_idx)
+
+
+#  method to check that all data lines of body_inner are found, in order and whole, in body_outer
+def is_contained(body_inner: bytes, body_outer: bytes):
+    body_inner = body_inner.rstrip(b'\r\n')
+    if not body_inner:
+        return True
+    haystack = b'\n' + body_outer
+    idx = haystack.find(b'\n' + body_inner)
+    while idx != -1:
+        end = idx + 1 + len(body_inner)
+        if end == len(haystack) or haystack[end:end + 1] in (b'\r', b'\n'):
+            return True
+        idx = haystack.find(b'\n' + body_inner, idx + 1)
+    return False
+
+
+#  method to load the stored file entries and containment results, see build_file_manifest
+def load_file_manifest(cache_folder: str):
+    manifest_path = os.path.join(cache_folder, 'file_manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}, {}
+    with open(manifest_path, encoding='utf8') as file:
+        manifest = json.load(file)
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {}, {}
+    return manifest['files'], manifest['contained']
+
+
+#  method to add file entries and containment results to the stored manifest, merged under the lock of the manifest
+def save_file_manifest(cache_folder: str, files: dict, contained: dict):
+    manifest_path = os.path.join(cache_folder, 'file_manifest.json')
+    with file_lock(f'{manifest_path}.lock'):
+        stored_files, stored_contained = load_file_manifest(cache_folder)
+        stored_files.update(files)
+        stored_contained.update(contained)
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as file:
+            json.dump({'version': MANIFEST_VERSION, 'files': stored_files, 'contained': stored_contained}, file,
+                      indent=1)
+        os.replace(tmp_path, manifest_path)
+
+
+#  method to get the size, content digest, header digest and time span of a GO file, reading it once
+def get_file_entry(f: str):
+    stat = os.stat(f)
+    header, body = read_lines(f)
+    start, end = get_line_span(header, body)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'digest': hashlib.blake2b(header + b'\n' + body, digest_size=16).hexdigest(),
+        'header': hashlib.blake2b(header, digest_size=16).hexdigest(),
+        'start': None if start is None else start.isoformat(),
+        'end': None if end is None else end.isoformat(),
+    }
+
+
+#  method to build a manifest of GO files with size, content digest and time span, flagging files that are exact
+#  duplicates of another file or whose data lines are all contained in another file with the same header. Such files
+#  add no rows after deduplication and do not need to be parsed. overlaps counts the other kept files overlapping
+#  in time. With a cache_folder the entries are stored keyed on path, size and mtime and the containment results
+#  keyed on the digests of both files, so only new or changed files are read again. Each file is read at most once
+#  for the containment checks.
+def build_file_manifest(file_list: list, cache_folder: str = None):
+    stored_files, stored_contained = load_file_manifest(cache_folder) if cache_folder is not None else ({}, {})
+    new_files = {}
+    rows = []
+    for f in file_list:
+        path = os.path.abspath(f)
+        stat = os.stat(f)
+        entry = stored_files.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            entry = get_file_entry(f)
+            new_files[path] = entry
+        rows.append({
+            'file': f,
+            'size': entry['size'],
+            'digest': entry['digest'],
+            'header': entry['header'],
+            'start': None if entry['start'] is None else datetime.fromisoformat(entry['start']),
+            'end': None if entry['end'] is None else datetime.fromisoformat(entry['end']),
+        })
+
+    # data lines of the files read for the containment checks, and the new containment results
+    bodies = {}
+    new_contained = {}
+
+    def get_body(f):
+        if f not in bodies:
+            bodies[f] = read_lines(f)[1]
+        return bodies[f]
+
+    def check_contained(inner, outer):
+        key = f"{inner['digest']}:{outer['digest']}"
+        if key not in stored_contained:
+            new_contained[key] = stored_contained[key] = is_contained(get_body(inner['file']),
+                                                                      get_body(outer['file']))
+        return stored_contained[key]
+
+    # larger files first, so that a file is compared with the files that may contain it
+    rows.sort(key=lambda row: (-row['size'], row['file']))
+    first_by_digest = {}
+    kept = []
+    for row in rows:
+        row['duplicate_of'] = first_by_digest.setdefault(row['digest'], row['file'])
+        if row['duplicate_of'] == row['file']:
+            row['duplicate_of'] = None
+        row['contained_in'] = None
+        if row['duplicate_of'] is None and row['start'] is not None:
+            for outer in kept:
+                if (outer['header'] == row['header'] and outer['start'] is not None
+                        and outer['start'] <= row['start'] and row['end'] <= outer['end']
+                        and check_contained(row, outer)):
+                    row['contained_in'] = outer['file']
+                    break
+        if row['duplicate_of'] is None and row['contained_in'] is None:
+            kept.append(row)
+
+    if cache_folder is not None and (new_files or new_contained):
+        save_file_manifest(cache_folder, new_files, new_contained)
+
+    for row in rows:
+        row['overlaps'] = 0 if row['start'] is None else sum(
+            1 for other in kept if other is not row and other['start'] is not None
+            and other['start'] <= row['end'] and row['start'] <= other['end']
+        )
+
+    df_manifest = pl.DataFrame(rows, schema={
+        'file': pl.Utf8, 'size': pl.Int64, 'digest': pl.Utf8, 'header': pl.Utf8, 'start': pl.Datetime,
+        'end': pl.Datetime, 'duplicate_of': pl.Utf8, 'contained_in': pl.Utf8, 'overlaps': pl.Int64,
+    })
+    return df_manifest.sort('start', 'file', nulls_last=True)
+
+
+#  method to get the files of a manifest that need to be parsed, in the order of file_list
+def get_files_to_parse(file_list: list, df_manifest: pl.DataFrame):
+    skipped = set(df_manifest.filter(
+        pl.col('duplicate_of').is_not_null() | pl.col('contained_in').is_not_null())['file'].to_list())
+    print(f'File manifest: {len(skipped)} of {len(file_list)} files are duplicated or contained in another file')
+    return [f for f in file_list if f not in skipped]
@@ -1,8 +1,16 @@
+import hashlib
 import pandas as pd
 import os
 import polars as pl
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+from ferrybox_catalog import (is_ferrybox_file, parse_ferrybox_file_times, load_ferrybox_catalog,
+                              query_ferrybox_catalog)
+from file_manifest import build_file_manifest, get_files_to_parse, get_line_span
+from ferrybox_store import update_ferrybox_store, read_ferrybox_store
+from ingest_cache import read_files_cached
+
 
 #  method to list all files in a folder
 def list_files(folder: str):
@@ -11,172 +19,241 @@ def list_files(folder: str):
     return file_list
 
 
-def list_ferrybox_files(folder: str, start_time: datetime, end_time: datetime):
+#  method to list ferrybox files overlapping start_time to end_time. With a catalog_path the persistent ferrybox
+#  catalog is used instead of listing the folder and parsing every file name.
+def list_ferrybox_files(folder: str, start_time: datetime, end_time: datetime, catalog_path: str = None):
+    if catalog_path is not None:
+        return query_ferrybox_catalog(load_ferrybox_catalog(folder, catalog_path), start_time, end_time)
+
     file_list = []
     for f in os.listdir(folder):
-        if (
-            f.endswith('.txt')
-            and ('Tavastland' in f or 'TransPaper' in f)
-            and ('Region' not in f)
-            and ('OK' in f)
-        ):
-            try:
-                parts = f.split('_')
-                start_time_str = parts[2]
-                end_time_str = parts[3]
-                start_time_file = datetime.strptime(start_time_str, "%Y%m%d%H%M%S")
-                end_time_file = datetime.strptime(end_time_str, "%Y%m%d%H%M%S")
-                if (end_time_file >= start_time) and (start_time_file <= end_time):
-                    file_list.append(os.path.join(folder, f))
-            except (IndexError, ValueError):
+        if is_ferrybox_file(f):
+            times = parse_ferrybox_file_times(f)
+            if times is None:
                 continue
+            start_time_file, end_time_file = times
+            if (end_time_file >= start_time) and (start_time_file <= end_time):
+                file_list.append(os.path.join(folder, f))
 
     return file_list
 
 
-#  method to read all listed files into a pandas dataframe
-def read_files_dynamic(file_list: list):
-    base_cols = ['Type', 'error', 'PC Date', 'PC Time', 'LI7810_SECONDS', 'equ temp', 'CO2 std val', 'CO2 ppm',
-                 'CO2 avg ppm', 'CO2 std ppm', 'CH4 ppb', 'CH4 avg ppb', 'CH4 std ppb', 'H2O ppt', 'H2O avg ppt',
-                 'H2O std ppt', 'licor temp', 'licor press', 'equ press', 'H2O flow', 'licor flow', 'equ pump',
-                 'vent flow', 'atm cond', 'equ cond', 'drip 1', 'cond temp', 'dry box temp', 'lab press', 'GPS Date',
-                 'GPS Time', 'Lat', 'Lon', 'SBE38', 'SBE45 Salinity', 'atm pressure', 'ALICAT press']
-    cols_str = ['Type', 'error', 'PC Date', 'PC Time', 'GPS Date', 'GPS Time']
-    cols_float = ['LI7810_SECONDS', 'equ temp', 'CO2 std val', 'CO2 ppm', 'CO2 avg ppm', 'CO2 std ppm', 'CH4 ppb',
-                  'CH4 avg ppb', 'CH4 std ppb', 'H2O ppt', 'H2O avg ppt', 'H2O std ppt', 'licor temp', 'licor press',
-                  'equ press', 'H2O flow', 'licor flow', 'equ pump', 'vent flow', 'atm cond', 'equ cond', 'drip 1',
-                  'cond temp', 'dry box temp', 'lab press', 'Lat', 'Lon', 'SBE38', 'SBE45 Salinity', 'atm pressure',
-                  'ALICAT press']
-    df = pl.DataFrame({
-        col: pl.Series([], dtype=pl.Utf8) if col in cols_str else pl.Series([], dtype=pl.Float64)
-        for col in base_cols
-    })
-
-    extra_cols = ['Type', 'error', 'PC Date', 'PC Time', 'CO2a W', 'CO2b W', 'H2Oa W', 'H2Ob W',
-                  'LI7810_DIAG', 'LI7810_CAVITY_P_kPa', 'LI7810_CAVITY_T_degC', 'LI7810_LASER_PHASE_P',
-                  'LI7810_LASER_T_RESIDUAL', 'LI7810_RING_DOWN_TIME', 'LI7810_THERMAL_ENCLOSURE_T',
-                  'LI7810_PHASE_ERROR', 'LI7810_LASER_T_SHIFT', 'drip 2'
-                  ]
-    df_extra = pl.DataFrame({
-        col: pl.Series([], dtype=pl.Utf8) for col in extra_cols
-    })
-
-    for f in file_list:
-        print(f)
-        df_temp = pl.read_csv(
-            f,
-            encoding="utf8",
-            separator="\t",
-            infer_schema=False,
-            missing_utf8_is_empty_string=True,
-            try_parse_dates=False,
-            truncate_ragged_lines=True
-        )
-
-        if df_temp.height == 0:
-            continue
-
-        df_temp = df_temp.rename({col: col.lstrip() for col in df_temp.columns})
-        df_temp = df_temp.filter(~pl.col('Type').str.contains('X'))  # remove rows with erroneous readings
-        if 'EquPress' in df_temp.columns:  # remove ragged rows using too many chars in equ press
-            df_temp = df_temp.filter(pl.col('EquPress').str.len_chars() <= 7)
-        else:
-            df_temp = df_temp.filter(pl.col('equ press').str.len_chars() <= 7)
-        df_temp = df_temp.with_columns(pl.all().str.replace_all(',', '.'))  # replace ,
-        # Handle missing data
-        df_temp = df_temp.with_columns([
-            pl.when(pl.col(c) == "").then(None).otherwise(pl.col(c)).alias(c) for c
-            in cols_float if c in df_temp.columns
-        ])
-
-        if 'GO139v2' in f:
-            if 'LI7810_H2O_ppm' in df_temp.columns:
-                df_temp = df_temp.with_columns(
-                    (pl.col('LI7810_H2O_ppm').cast(pl.Float64, strict=False) / 1000).alias('H2O ppt')
-                )
-
-            if 'LI7810_H2O_ppm_avg' in df_temp.columns:
-                df_temp = df_temp.with_columns(
-                    (pl.col('LI7810_H2O_ppm_avg').cast(pl.Float64, strict=False) / 1000).alias('H2O avg ppt')
-                )
-
-            if 'LI7810_H2O_ppm_stdev' in df_temp.columns:
-                df_temp = df_temp.with_columns(
-                    (pl.col('LI7810_H2O_ppm_stdev').cast(pl.Float64, strict=False) / 1000).alias('H2O std ppt')
-                )
-
-            df_temp = df_temp.rename({
-                'Error': 'error',
-                'PcDate': 'PC Date',
-                'PcTime': 'PC Time',
-                'EquTemp': 'equ temp',
-                'CO2StdValue': 'CO2 std val',
-                'LI7810_CO2_ppm': 'CO2 ppm',
-                'LI7810_CO2_ppm_avg': 'CO2 avg ppm',
-                'LI7810_CO2_ppm_stdev': 'CO2 std ppm',
-                'LI7810_CH4_ppb': 'CH4 ppb',
-                'LI7810_CH4_ppb_avg': 'CH4 avg ppb',
-                'LI7810_CH4_ppb_stdev': 'CH4 std ppb',
-                'EquPress': 'equ press',
-                'EquH2OFlow': 'H2O flow',
-                'LicorFlow': 'licor flow',
-                'VentFlow': 'vent flow',
-                'AtmCond': 'atm cond',
-                'EquCond': 'equ cond',
-                'Drip1': 'drip 1',
-                'CondTemp': 'cond temp',
-                'DryBoxTemp': 'dry box temp'
-            })
+BASE_COLS = ['Type', 'error', 'PC Date', 'PC Time', 'LI7810_SECONDS', 'equ temp', 'CO2 std val', 'CO2 ppm',
+             'CO2 avg ppm', 'CO2 std ppm', 'CH4 ppb', 'CH4 avg ppb', 'CH4 std ppb', 'H2O ppt', 'H2O avg ppt',
+             'H2O std ppt', 'licor temp', 'licor press', 'equ press', 'H2O flow', 'licor flow', 'equ pump',
+             'vent flow', 'atm cond', 'equ cond', 'drip 1', 'cond temp', 'dry box temp', 'lab press', 'GPS Date',
+             'GPS Time', 'Lat', 'Lon', 'SBE38', 'SBE45 Salinity', 'atm pressure', 'ALICAT press']
+COLS_STR = ['Type', 'error', 'PC Date', 'PC Time', 'GPS Date', 'GPS Time']
+COLS_FLOAT = ['LI7810_SECONDS', 'equ temp', 'CO2 std val', 'CO2 ppm', 'CO2 avg ppm', 'CO2 std ppm', 'CH4 ppb',
+              'CH4 avg ppb', 'CH4 std ppb', 'H2O ppt', 'H2O avg ppt', 'H2O std ppt', 'licor temp', 'licor press',
+              'equ press', 'H2O flow', 'licor flow', 'equ pump', 'vent flow', 'atm cond', 'equ cond', 'drip 1',
+              'cond temp', 'dry box temp', 'lab press', 'Lat', 'Lon', 'SBE38', 'SBE45 Salinity', 'atm pressure',
+              'ALICAT press']
+EXTRA_COLS = ['Type', 'error', 'PC Date', 'PC Time', 'CO2a W', 'CO2b W', 'H2Oa W', 'H2Ob W',
+              'LI7810_DIAG', 'LI7810_CAVITY_P_kPa', 'LI7810_CAVITY_T_degC', 'LI7810_LASER_PHASE_P',
+              'LI7810_LASER_T_RESIDUAL', 'LI7810_RING_DOWN_TIME', 'LI7810_THERMAL_ENCLOSURE_T',
+              'LI7810_PHASE_ERROR', 'LI7810_LASER_T_SHIFT', 'drip 2'
+              ]
+ALL_COLS = BASE_COLS + [col for col in EXTRA_COLS if col not in BASE_COLS]
+
+
+GO139V2_RENAME = {
+    'Error': 'error',
+    'PcDate': 'PC Date',
+    'PcTime': 'PC Time',
+    'EquTemp': 'equ temp',
+    'CO2StdValue': 'CO2 std val',
+    'LI7810_CO2_ppm': 'CO2 ppm',
+    'LI7810_CO2_ppm_avg': 'CO2 avg ppm',
+    'LI7810_CO2_ppm_stdev': 'CO2 std ppm',
+    'LI7810_CH4_ppb': 'CH4 ppb',
+    'LI7810_CH4_ppb_avg': 'CH4 avg ppb',
+    'LI7810_CH4_ppb_stdev': 'CH4 std ppb',
+    'EquPress': 'equ press',
+    'EquH2OFlow': 'H2O flow',
+    'LicorFlow': 'licor flow',
+    'VentFlow': 'vent flow',
+    'AtmCond': 'atm cond',
+    'EquCond': 'equ cond',
+    'Drip1': 'drip 1',
+    'CondTemp': 'cond temp',
+    'DryBoxTemp': 'dry box temp'
+}
+GO139V2_H2O_PPM = {
+    'LI7810_H2O_ppm': 'H2O ppt',
+    'LI7810_H2O_ppm_avg': 'H2O avg ppt',
+    'LI7810_H2O_ppm_stdev': 'H2O std ppt',
+}
+LEGACY_RENAME = {
+    'std val': 'CO2 std val',
+    'CO2 um/m': 'CO2 ppm',
+    'H2O mm/m': 'H2O ppt'
+}
+
+# compiled normalisation plans keyed on the hash of the header line
+_dialect_plans = {}
+
+
+#  method to read the header line of a file and check that it holds more than a header line
+def read_header(f: str):
+    with open(f, 'rb') as file:
+        header = file.readline()
+        has_data = any(line.strip() for line in file)
+    return header.rstrip(b'\r\n'), has_data
+
+
+#  method to identify the file layout from its columns, GO139v2 firmware uses camel case and LI7810 prefixed names
+def identify_dialect(columns: list):
+    if 'PcDate' in columns or 'LI7810_CO2_ppm' in columns:
+        return 'GO139v2'
+    return 'legacy'
+
+
+#  method to compile the rename, cast and derive steps of a file layout into one filter and one projection
+def compile_dialect_plan(columns: list):
+    dialect = identify_dialect(columns)
+    rename = GO139V2_RENAME if dialect == 'GO139v2' else LEGACY_RENAME
+    sources = {rename.get(col, col): col for col in columns}
+    if 'Date' in sources:
+        sources['PC Date'] = sources.pop('Date')
+
+    def to_float(col):
+        return pl.col(col).str.replace_all(',', '.').cast(pl.Float64, strict=False)
+
+    derived = {}
+    if dialect == 'GO139v2':
+        derived = {target: to_float(col) / 1000 for col, target in GO139V2_H2O_PPM.items() if col in columns}
+
+    projection = []
+    for col in ALL_COLS:
+        if col in COLS_FLOAT:
+            if col in derived:
+                expr = derived[col]
+            elif col in sources:
+                expr = to_float(sources[col])
+            else:
+                projection.append(pl.lit(None, dtype=pl.Float64).alias(col))
+                continue
+            # Replace missing data=-999 with null. Not an issue in recent files, can be silenced depending on data set.
+            expr = pl.when(expr == -999).then(None).otherwise(expr)
+            if col == 'equ temp':
+                # Replace missing equ temp==0 with null. Not an issue in recent files, can be silenced depending on
+                # data set.
+                expr = pl.when(expr == 0).then(None).otherwise(expr)
+            projection.append(expr.alias(col))
+        elif col in sources:
+            projection.append(pl.col(sources[col]).str.replace_all(',', '.').alias(col))
         else:
-            df_temp = df_temp.rename({'std val': 'CO2 std val',
-                                      'CO2 um/m': 'CO2 ppm',
-                                      'H2O mm/m': 'H2O ppt'},
-                                     )
-        if 'Date' in df_temp.columns:
-            df_temp = df_temp.rename({
-                'Date': 'PC Date',
-            })
-
-        # Convert to numeric
-        df_temp = df_temp.with_columns([
-            pl.col(c).cast(pl.Float64, strict=False) for c in cols_float if c in df_temp.columns
-        ])
-
-        # Replace missing data=-999 with null. Not an issue in recent files, can be silenced depending on data set.
-        df_temp = df_temp.with_columns([
-            pl.when(pl.col(c) == -999).then(None).otherwise(pl.col(c)).alias(c) for c
-            in cols_float if c in df_temp.columns
-        ])
-
-        # Replace missing equ temp==0 with null. Not an issue in recent files, can be silenced depending on data set.
-        df_temp = df_temp.with_columns([
-            pl.when(pl.col('equ temp') == 0).then(None).otherwise(pl.col('equ temp')).alias('equ temp')
-        ])
-
-        missing_cols = [col for col in base_cols if col not in df_temp.columns]
-        df_temp = df_temp.with_columns([
-            pl.lit(None, dtype=pl.Utf8).alias(col) if col in cols_str else pl.lit(None, dtype=pl.Float64).alias(col)
-            for col in missing_cols
-        ])
-
-        missing_cols = [col for col in extra_cols if col not in df_temp.columns]
-        df_temp = df_temp.with_columns([
-            pl.lit(None, dtype=pl.Utf8).alias(col) for col in missing_cols
-        ])
-
-        df = pl.concat([df, df_temp.select(base_cols)], how="vertical", rechunk=True)
-        df_extra = pl.concat([df_extra, df_temp.select(extra_cols)], how="vertical", rechunk=True)
-
-    # remove duplicated rows if existing
-    df = df.unique()
-    df_extra = df_extra.unique()
-
-    # add datetime time series
-    df = df.with_columns(
-        (
-                pl.col("PC Date") + " " + pl.col("PC Time")
-        ).str.strptime(pl.Datetime, format="%d/%m/%y %H:%M:%S").alias("time series")
+            projection.append(pl.lit(None, dtype=pl.Utf8).alias(col))
+
+    # remove rows with erroneous readings and ragged rows using too many chars in equ press
+    equ_press = sources.get('equ press', 'equ press')
+    row_filter = ~pl.col('Type').str.contains('X') & (pl.col(equ_press).str.len_chars() <= 7)
+    return {'dialect': dialect, 'filter': row_filter, 'projection': projection}
+
+
+#  method to get the compiled plan for a header line, plans are cached per header hash
+def get_dialect_plan(header: bytes):
+    key = hashlib.sha1(header).hexdigest()
+    plan = _dialect_plans.get(key)
+    if plan is None:
+        columns = [col.lstrip() for col in header.decode('utf8').split('\t')]
+        plan = compile_dialect_plan(columns)
+        _dialect_plans[key] = plan
+    return plan
+
+
+#  method to build a lazy query plan that reads and normalises a single GO file, returns None for empty files. The
+#  layout is identified from the header line and normalised with a single precompiled projection.
+def scan_file(f: str):
+    print(f)
+    header, has_data = read_header(f)
+    if not has_data:
+        return None
+
+    plan = get_dialect_plan(header)
+    df_temp = pl.scan_csv(
+        f,
+        encoding="utf8",
+        separator="\t",
+        infer_schema=False,
+        missing_utf8_is_empty_string=True,
+        try_parse_dates=False,
+        truncate_ragged_lines=True,
+        with_column_names=lambda cols: [col.lstrip() for col in cols]
     )
+    return df_temp.filter(plan['filter']).select(plan['projection'])
+
+
+#  method to read and normalise a single GO file, returns None for empty files
+def read_file(f: str):
+    df_temp = scan_file(f)
+    if df_temp is None:
+        return None
+    return df_temp.collect()
+
+
+#  method to read all listed files into a polars dataframe. With workers > 1 the files are parsed in a thread pool
+#  (polars releases the GIL while parsing) and the pieces are concatenated once at the end. With lazy=True the query
+#  plans of all files are concatenated and collected once, letting polars fuse the passes and skip unused columns.
+#  With a cache_folder each file's normalised output is cached as parquet and only new or changed files are parsed.
+#  With skip_overlapping files that are exact duplicates of, or contained in, another file are skipped before parsing,
+#  the file manifest is then stored in the cache_folder.
+#  With a window, e.g. '1mo', the files are read as time ordered windows with read_files_windowed and the windows are
+#  concatenated, so only the raw pieces of the files of one window are held at a time while parsing. The returned
+#  frames still hold all windows, so the memory of the caller is not bounded by the window.
+def read_files_dynamic(file_list: list, workers: int = 1, lazy: bool = False, cache_folder: str = None,
+                       skip_overlapping: bool = False, window: str = None):
+    if skip_overlapping:
+        file_list = get_files_to_parse(file_list, build_file_manifest(file_list, cache_folder))
+    if window is not None:
+        windows = list(read_files_windowed(file_list, window, workers, cache_folder))
+        if windows:
+            return (pl.concat([df for df, _ in windows], how="vertical", rechunk=True),
+                    pl.concat([df_extra for _, df_extra in windows], how="vertical", rechunk=True))
+        pieces = []
+    elif cache_folder is not None:
+        pieces = read_files_cached(file_list, read_file, cache_folder, workers)
+    elif lazy:
+        plans = [plan for plan in (scan_file(f) for f in file_list) if plan is not None]
+        pieces = [pl.concat(plans, how="vertical").collect()] if plans else []
+    elif workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pieces = list(executor.map(read_file, file_list))
+    else:
+        pieces = [read_file(f) for f in file_list]
+    pieces = [piece for piece in pieces if piece is not None]
+
+    if pieces:
+        df = pl.concat(pieces, how="vertical", rechunk=True)
+    else:
+        df = pl.DataFrame({
+            col: pl.Series([], dtype=pl.Float64) if col in COLS_FLOAT else pl.Series([], dtype=pl.Utf8)
+            for col in ALL_COLS
+        })
+
+    return finalise_go_frames(df)
+
+
+def get_time_series_expr():
+    return (
+            pl.col("PC Date") + " " + pl.col("PC Time")
+    ).str.strptime(pl.Datetime, format="%d/%m/%y %H:%M:%S")
+
+
+#  method to deduplicate, add time columns and sort GO data with base and extra columns, returns the base and the
+#  extra columns as two row aligned frames. elapsed time (s) is counted from origin, by default the first time stamp.
+def finalise_go_frames(df: pl.DataFrame, origin: datetime = None):
+    # add datetime time series
+    df = df.with_columns(get_time_series_expr().alias("time series"))
+
+    # remove duplicated rows if existing, keyed on time stamp, Type and a hash of the base columns. The extra columns
+    # of the first copy are kept, so that df and df_extra stay aligned.
+    df = df.with_columns(pl.struct(BASE_COLS).hash().alias("row hash"))
+    df = df.unique(subset=["time series", "Type", "row hash"], keep="first", maintain_order=True)
+    df = df.sort('time series', maintain_order=True)
+    df_extra = df.select(EXTRA_COLS + ["time series"])
+    df = df.select(BASE_COLS + ["time series"])
 
     # add year, month, day, hour, min
     df = df.with_columns([
@@ -187,19 +264,95 @@ def read_files_dynamic(file_list: list):
         pl.col("time series").dt.minute().alias("Minute"),
     ])
 
-    df = df.sort('time series')
+    first_time = pl.col("time series").first() if origin is None else pl.lit(origin, dtype=pl.Datetime)
     df = df.with_columns(
-        (pl.col("time series") - pl.col("time series").first()).dt.total_seconds().alias("elapsed time (s)")
+        (pl.col("time series") - first_time).dt.total_seconds().alias("elapsed time (s)")
     )
-    df_extra = df_extra.with_columns(
-        (
-                pl.col("PC Date") + " " + pl.col("PC Time")
-        ).str.strptime(pl.Datetime, format="%d/%m/%y %H:%M:%S").alias("time series")
-    )
-    df_extra = df_extra.sort('time series')
     return df, df_extra
 
 
+#  method to get the first and last time stamp of a GO file from its first and last data line, without parsing the
+#  file. Only the header, the first data line and the tail of the file are read.
+def get_file_time_span(f: str, tail_bytes: int = 65536):
+    with open(f, 'rb') as file:
+        header = file.readline().rstrip(b'\r\n')
+        first_line = next((line for line in file if line.strip()), None)
+        if first_line is None:
+            return None
+        file.seek(max(0, os.path.getsize(f) - tail_bytes))
+        last_line = [line for line in file.read().split(b'\n') if line.strip()][-1]
+    start, end = get_line_span(header, first_line.rstrip(b'\r\n') + b'\n' + last_line)
+    if start is None or end is None:
+        return None
+    return start, end
+
+
+#  method to read GO files as time ordered windows, e.g. window='1w' or '1mo'. Only the files overlapping the current
+#  window are held in memory, so peak memory is bounded by the window size rather than by the archive. Each row
+#  belongs to exactly one window, so duplicates from files with overlapping time ranges are removed also across
+#  window boundaries. elapsed time (s) is counted from the first time stamp kept after the Type and equilibrator
+#  pressure filters, as in read_files_dynamic.
+#  The time span of each file is taken from its first and last line, rows without a time stamp and rows before the
+#  window in which their file is read are dropped and counted.
+def read_files_windowed(file_list: list, window: str = '1mo', workers: int = 1, cache_folder: str = None):
+    spans = {}
+    for f in file_list:
+        span = get_file_time_span(f)
+        if span is None:
+            print(f'{f}: no time stamps in the first and last line, skipped')
+            continue
+        spans[f] = span
+    if not spans:
+        return
+
+    first = min(start for start, _ in spans.values())
+    last = max(end for _, end in spans.values())
+    window_starts = pl.datetime_range(
+        pl.lit(first).dt.truncate(window), last, interval=window, eager=True
+    ).to_list()
+
+    # the first line of a file may be removed by the filters, so the origin is taken from the first non-empty window
+    origin = None
+    loaded = {}
+    for window_start in window_starts:
+        window_end = pl.select(pl.lit(window_start).dt.offset_by(window)).item()
+        window_files = [f for f, (start, end) in spans.items() if start < window_end and end >= window_start]
+        to_read = [f for f in window_files if f not in loaded]
+        if cache_folder is not None:
+            pieces = read_files_cached(to_read, read_file, cache_folder, workers)
+        elif workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pieces = list(executor.map(read_file, to_read))
+        else:
+            pieces = [read_file(f) for f in to_read]
+
+        for f, piece in zip(to_read, pieces):
+            loaded[f] = piece
+            if piece is None:
+                continue
+            # rows of files not written in time order may lie outside the span of the first and last line
+            times = piece.select(get_time_series_expr().alias('time series'))['time series']
+            dropped = times.null_count() + (times < window_start).sum()
+            if dropped:
+                print(f'{f}: {dropped} rows without time stamp or before {window_start} dropped')
+            if times.max() is not None and times.max() > spans[f][1]:
+                spans[f] = (spans[f][0], times.max())
+
+        in_window = (get_time_series_expr() >= window_start) & (get_time_series_expr() < window_end)
+        pieces = [loaded[f].filter(in_window) for f in window_files if loaded[f] is not None]
+        pieces = [piece for piece in pieces if piece.height > 0]
+        if pieces:
+            df, df_extra = finalise_go_frames(pl.concat(pieces, how="vertical", rechunk=True), origin)
+            if origin is None:
+                origin = df['time series'][0]
+            yield df, df_extra
+
+        # release files that end in this window
+        for f in window_files:
+            if spans[f][1] < window_end:
+                del loaded[f]
+
+
 def read_standards(standards_path: str):
     df_stds = pd.read_excel(standards_path)
     df_stds['Start time'] = pd.to_timedelta(df_stds['Start time'].astype(str))
@@ -210,43 +363,78 @@ def read_standards(standards_path: str):
     return df_stds
 
 
-def read_ferrybox_files_dynamic(file_list: list):
-    base_cols = ['38055', '38003', '8002', '88002', '8003', '88003', '8172', '88172',
-                 '8181', '88181', '8179', '88179', '8180', '88180', '72', '80072', '70',
-                 '80070', '8032', '88032', '8165', '88165', '8173', '88173', '8191', '88191',
-                 '8063', '88063', '8174','88174', 'Time_series']
-
-    df = pl.DataFrame()
-
-    for f in file_list:
-        print(f)
-        df_temp = pl.read_csv(
-            f,
-            encoding='utf8',
-            separator='\t',
-            infer_schema=False,
-            has_header=True,
-            try_parse_dates=False,
-            missing_utf8_is_empty_string=True,
-            truncate_ragged_lines=True
-        )
-
-        df_temp = df_temp.rename({col: col.lstrip() for col in df_temp.columns})
-        if "38003" in df_temp.columns:
-            df_temp = df_temp.with_columns([pl.col("38003").
-                                            str.strptime(pl.Datetime, strict=False,
-                                                         format="%Y%m%d%H%M%S").alias("Time_series")])
-        else:
-            df_temp = df_temp.with_columns([pl.col("38055").
-                                           str.strptime(pl.Datetime, format="%Y%m%d%H%M%S",
-                                                        strict=False).alias("Time_series")])
+FERRYBOX_BASE_COLS = ['38055', '38003', '8002', '88002', '8003', '88003', '8172', '88172',
+                      '8181', '88181', '8179', '88179', '8180', '88180', '72', '80072', '70',
+                      '80070', '8032', '88032', '8165', '88165', '8173', '88173', '8191', '88191',
+                      '8063', '88063', '8174','88174', 'Time_series']
+FERRYBOX_COLS = ["Latitude", "QF Latitude", "Longitude", "QF Longitude", "Water_flow", "QF Water_flow", "SST",
+                 "QF SST", "SSS", "QF SSS", "Air_temperature", "QF Air_temperature", "Atm_pressure",
+                 "QF Atm_pressure", "QFF", "QF QFF", "CDOM", "QF CDOM", "Phycocyanin", "QF Phycocyanin", "O2",
+                 "QF O2", "Chl_fluorescense", "QF Chl_fluorescense", "Turbidity", "QF Turbidity"]
+FERRYBOX_EXPORT_COLS = [
+    "Time_series",
+    "Latitude",
+    "QF Latitude",
+    "Longitude",
+    "QF Longitude",
+    "SST",
+    "QF SST",
+    "SSS",
+    "QF SSS",
+    "Air_temperature",
+    "QF Air_temperature",
+    "Atm_pressure",
+    "QF Atm_pressure",
+    "QFF",
+    "QF QFF",
+    "CDOM",
+    "QF CDOM",
+    "Phycocyanin",
+    "QF Phycocyanin",
+    "O2",
+    "QF O2",
+    "Chl_fluorescense",
+    "QF Chl_fluorescense",
+    "Turbidity",
+    "QF Turbidity"
+]
+FERRYBOX_EXPORT_SCHEMA = {
+    col: pl.Datetime("us") if col == "Time_series" else pl.Float64 for col in FERRYBOX_EXPORT_COLS
+}
+
+
+#  method to read a single ferrybox file as string columns with a parsed time series
+def read_ferrybox_file(f: str):
+    print(f)
+    df_temp = pl.read_csv(
+        f,
+        encoding='utf8',
+        separator='\t',
+        infer_schema=False,
+        has_header=True,
+        try_parse_dates=False,
+        missing_utf8_is_empty_string=True,
+        truncate_ragged_lines=True
+    )
 
-        for col in base_cols:
-            if col not in df_temp.columns:
-                df_temp = df_temp.with_columns(pl.lit(None, dtype=pl.Utf8).alias(col))
+    df_temp = df_temp.rename({col: col.lstrip() for col in df_temp.columns})
+    if "38003" in df_temp.columns:
+        df_temp = df_temp.with_columns([pl.col("38003").
+                                        str.strptime(pl.Datetime, strict=False,
+                                                     format="%Y%m%d%H%M%S").alias("Time_series")])
+    else:
+        df_temp = df_temp.with_columns([pl.col("38055").
+                                       str.strptime(pl.Datetime, format="%Y%m%d%H%M%S",
+                                                    strict=False).alias("Time_series")])
+
+    df_temp = df_temp.with_columns([
+        pl.lit(None, dtype=pl.Utf8).alias(col) for col in FERRYBOX_BASE_COLS if col not in df_temp.columns
+    ])
+    return df_temp.select(FERRYBOX_BASE_COLS)
 
-        df = pl.concat([df, df_temp.select(base_cols)], how="vertical", rechunk=True)
 
+#  method to deduplicate, rename, type and QF filter raw ferrybox data
+def normalise_ferrybox(df: pl.DataFrame):
     df = df.unique()
     df = df.sort("Time_series")
     df = df.rename({
@@ -282,58 +470,42 @@ def read_ferrybox_files_dynamic(file_list: list):
         #"88175": "QF PAR",
     })
 
-    cols = ["Latitude", "QF Latitude", "Longitude", "QF Longitude", "Water_flow", "QF Water_flow", "SST", "QF SST",
-            "SSS", "QF SSS", "Air_temperature", "QF Air_temperature", "Atm_pressure", "QF Atm_pressure", "QFF",
-            "QF QFF", "CDOM", "QF CDOM", "Phycocyanin", "QF Phycocyanin", "O2", "QF O2", "Chl_fluorescense",
-            "QF Chl_fluorescense", "Turbidity", "QF Turbidity"]
-
-    for col in cols:
-        df = df.with_columns(
-            pl.col(col)
-            .str.strip_chars()
-            .replace("", None)
-            .cast(pl.Float64)
-            .alias(col)
-        )
+    df = df.with_columns([
+        pl.col(col)
+        .str.strip_chars()
+        .replace("", None)
+        .cast(pl.Float64)
+        .alias(col)
+        for col in FERRYBOX_COLS
+    ])
 
     df = df.filter(
         (pl.col("QF Water_flow") >= 0) & (pl.col("QF Water_flow") < 3)
     )
 
     df = df.with_columns([
-        pl.when(pl.col(col) == -999).then(None).otherwise(pl.col(col)).alias(col) for col in cols
+        pl.when(pl.col(col) == -999).then(None).otherwise(pl.col(col)).alias(col) for col in FERRYBOX_COLS
     ])
 
-    df_fb = df.select([
-        "Time_series",
-        "Latitude",
-        "QF Latitude",
-        "Longitude",
-        "QF Longitude",
-        "SST",
-        "QF SST",
-        "SSS",
-        "QF SSS",
-        "Air_temperature",
-        "QF Air_temperature",
-        "Atm_pressure",
-        "QF Atm_pressure",
-        "QFF",
-        "QF QFF",
-        "CDOM",
-        "QF CDOM",
-        "Phycocyanin",
-        "QF Phycocyanin",
-        "O2",
-        "QF O2",
-        "Chl_fluorescense",
-        "QF Chl_fluorescense",
-        "Turbidity",
-        "QF Turbidity"
-    ])
+    df_fb = df.select(FERRYBOX_EXPORT_COLS)
     return df_fb
 
 
+#  method to read listed ferrybox files. With a store_folder the files are converted once into the local month
+#  partitioned ferrybox store and only the partitions overlapping start_time to end_time are read, without a range
+#  the whole listed files are read.
+def read_ferrybox_files_dynamic(file_list: list, store_folder: str = None, start_time: datetime = None,
+                                end_time: datetime = None):
+    if store_folder is not None:
+        update_ferrybox_store(file_list, store_folder, read_ferrybox_file, normalise_ferrybox)
+        return read_ferrybox_store(store_folder, start_time, end_time, file_list, FERRYBOX_EXPORT_SCHEMA)
+
+    df = pl.DataFrame()
+    for f in file_list:
+        df = pl.concat([df, read_ferrybox_file(f)], how="vertical", rechunk=True)
+    return normalise_ferrybox(df)
+
+
 def merge_go_and_ferrybox(df: pd.DataFrame, df_fb: pd.DataFrame):
     df = pd.merge_asof(
         df.reset_index(),
@@ -343,6 +515,27 @@ def merge_go_and_ferrybox(df: pd.DataFrame, df_fb: pd.DataFrame):
     return df
 
 
+#  method to merge ferrybox data to the nearest GO time stamp within 60 s using polars as-of joins. Gives the same
+#  result as merge_go_and_ferrybox: on equal distance the earlier ferrybox row is used, for duplicated ferrybox time
+#  stamps the last row backward and the first row forward. The rows keep their order and are not reindexed.
+def merge_go_and_ferrybox_polars(df: pl.DataFrame, df_fb: pl.DataFrame):
+    if not df['time series'].is_sorted():
+        raise ValueError("left keys must be sorted")
+    df_fb = df_fb.filter(pl.col('Time_series').is_not_null()).sort('Time_series', maintain_order=True)
+    fb_keys = df_fb.select('Time_series').with_row_index('fb_row')
+    keys = df.select('time series')
+    backward = keys.join_asof(fb_keys, left_on='time series', right_on='Time_series',
+                              strategy='backward', tolerance='60s')
+    forward = keys.join_asof(fb_keys, left_on='time series', right_on='Time_series',
+                             strategy='forward', tolerance='60s')
+    use_forward = (
+        backward['fb_row'].is_null() |
+        ((forward['Time_series'] - keys['time series']) < (keys['time series'] - backward['Time_series']))
+    ).fill_null(False)
+    fb_row = pl.select(pl.when(use_forward).then(forward['fb_row']).otherwise(backward['fb_row'])).to_series()
+    return df.hstack(df_fb.select(pl.all().gather(fb_row)))
+
+
 def merge_ferrybox_and_go(df_fb: pd.DataFrame, df_go: pd.DataFrame, ):
     df_merged = pd.merge_asof(
         df_fb.reset_index(),
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+from file_lock import file_lock
+
+# bump when the normalisation in file_reader.read_file changes, so that cached files are parsed again
+CACHE_VERSION = 2
+
+
+def get_ingest_cache_path():
+    cache_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest_cache")
+    os.makedirs(cache_folder, exist_ok=True)
+    return cache_folder
+
+
+def get_file_key(f: str):
+    stat = os.stat(f)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_manifest(cache_folder: str):
+    manifest_path = os.path.join(cache_folder, 'manifest.json')
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf8') as file:
+        manifest = json.load(file)
+    if manifest.get('version') != CACHE_VERSION:
+        return {}
+    return manifest['files']
+
+
+#  method to add updated entries to the manifest on disk. The manifest is read again, merged and replaced while
+#  holding the lock of the cache folder, so that runs in parallel processes sharing the cache do not drop each other's
+#  entries.
+def save_manifest(cache_folder: str, updates: dict):
+    manifest_path = os.path.join(cache_folder, 'manifest.json')
+    with file_lock(f'{manifest_path}.lock'):
+        manifest = load_manifest(cache_folder)
+        manifest.update(updates)
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf8') as file:
+            json.dump({'version': CACHE_VERSION, 'files': manifest}, file, indent=1)
+        os.replace(tmp_path, manifest_path)
+
+
+#  method to read listed files through a per-file parquet cache keyed on path, size and mtime. Only new or changed
+#  files are parsed with reader, the others are memory mapped from the cache. Returns one frame (or None) per file.
+def read_files_cached(file_list: list, reader, cache_folder: str, workers: int = 1):
+    os.makedirs(cache_folder, exist_ok=True)
+    manifest = load_manifest(cache_folder)
+
+    pieces = {}
+    to_parse = []
+    for f in file_list:
+        path = os.path.abspath(f)
+        key = get_file_key(f)
+        entry = manifest.get(path)
+        if entry is not None and entry['size'] == key['size'] and entry['mtime_ns'] == key['mtime_ns']:
+            if entry['parquet'] is None:
+                pieces[f] = None
+                continue
+            parquet_path = os.path.join(cache_folder, entry['parquet'])
+            if os.path.exists(parquet_path):
+                pieces[f] = pl.read_parquet(parquet_path, memory_map=True)
+                continue
+        to_parse.append((f, path, key))
+
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(reader, [f for f, _, _ in to_parse]))
+    else:
+        parsed = [reader(f) for f, _, _ in to_parse]
+
+    updates = {}
+    for (f, path, key), df_temp in zip(to_parse, parsed):
+        pieces[f] = df_temp
+        parquet_name = None
+        if df_temp is not None:
+            parquet_name = hashlib.sha1(path.encode('utf8')).hexdigest() + '.parquet'
+            parquet_path = os.path.join(cache_folder, parquet_name)
+            df_temp.write_parquet(f'{parquet_path}.{os.getpid()}.tmp')
+            os.replace(f'{parquet_path}.{os.getpid()}.tmp', parquet_path)
+        updates[path] = {'size': key['size'], 'mtime_ns': key['mtime_ns'], 'parquet': parquet_name}
+
+    if updates:
+        save_manifest(cache_folder, updates)
+    print(f'Ingest cache: {len(file_list) - len(to_parse)} cached, {len(to_parse)} parsed')
+    return [pieces[f] for f in file_list]
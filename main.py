@@ -1,6 +1,127 @@
-def main():
-    print("Hello from go-co2-data-processing!")
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from export_results import get_data_path
+from process_data import FB_FOLDER, STANDARDS_PATH, catalog_folder_standards, process_folder
+
+# directory holding one folder of GO files per year
+DATA_FOLDER = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA'
+
+
+#  method to get the folder of GO files for a year, or the folder itself if a path is given. Early years keep their
+#  files in a sub folder all_dat_files_<year>.
+def get_co2_folder(year_or_folder: str, data_folder: str = DATA_FOLDER):
+    if not year_or_folder.isdigit():
+        return year_or_folder
+    year_folder = os.path.join(data_folder, year_or_folder)
+    all_dat_folder = os.path.join(year_folder, f'all_dat_files_{year_or_folder}')
+    if os.path.isdir(all_dat_folder):
+        return all_dat_folder
+    return year_folder
+
+
+#  method to store the standard runs of one folder in the standards catalog, executed in a worker process
+def run_catalog_folder(co2_folder: str, standards_path: str, read_workers: int, read_window: str = None):
+    try:
+        runs = catalog_folder_standards(co2_folder, standards_path, read_workers, read_window)
+        return f'{runs} standard runs stored'
+    except Exception:
+        return f"failed {traceback.format_exc().strip().splitlines()[-1]}"
+
+
+#  method to run the pipeline for one folder, executed in a worker process
+def run_folder(co2_folder: str, fb_folder: str, standards_path: str, plot: bool, read_workers: int,
+               engine: str = 'pandas', compact: bool = False, uncertainty_draws: int = 0,
+               sweep_thresholds: bool = False, expand_coefficients: bool = True, concurrent_gases: bool = True,
+               standards_catalog: bool = False, read_window: str = None):
+    start = time.perf_counter()
+    try:
+        df = process_folder(co2_folder, fb_folder, standards_path, plot=plot, read_workers=read_workers,
+                            engine=engine, compact=compact, uncertainty_draws=uncertainty_draws,
+                            sweep_thresholds=sweep_thresholds, expand_coefficients=expand_coefficients,
+                            concurrent_gases=concurrent_gases, standards_catalog=standards_catalog,
+                            read_window=read_window)
+        status = 'no data' if df is None else 'ok'
+        rows = 0 if df is None else len(df)
+        error = ''
+    except Exception:
+        status = 'failed'
+        rows = 0
+        error = traceback.format_exc().strip().splitlines()[-1]
+    return {
+        'folder': co2_folder,
+        'status': status,
+        'rows': rows,
+        'seconds': round(time.perf_counter() - start, 1),
+        'error': error,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Process GO xCO2/xCH4 data for one or more years, each year in a separate process.')
+    parser.add_argument('years', nargs='+', help='years, e.g. 2012 2013, or paths to folders with GO files')
+    parser.add_argument('--workers', type=int, default=1, help='number of years processed at the same time')
+    parser.add_argument('--data-folder', default=DATA_FOLDER, help='folder holding one folder per year')
+    parser.add_argument('--fb-folder', default=FB_FOLDER, help='folder with quality controlled ferrybox files')
+    parser.add_argument('--standards-path', default=STANDARDS_PATH, help='excel file with certified standard gases')
+    parser.add_argument('--plots', action='store_true', help='create and show the figures for each year')
+    parser.add_argument('--engine', choices=['pandas', 'polars'], default='pandas',
+                        help='engine for the co2 and ch4 calculation chains')
+    parser.add_argument('--compact', action='store_true',
+                        help='use a compact working frame with packed flags and float32 housekeeping channels')
+    parser.add_argument('--uncertainty-draws', type=int, default=0,
+                        help='number of Monte Carlo draws per row for the uncertainty percentiles, 0 to skip')
+    parser.add_argument('--sweep-thresholds', action='store_true',
+                        help='export the retained rows for a grid of calibration and standard thresholds')
+    parser.add_argument('--segment-coefficients', action='store_true',
+                        help='do not write the calibration coefficients per row, plot them at the start of each '
+                             'calibration segment')
+    parser.add_argument('--sequential-gases', action='store_true',
+                        help='run the co2 and ch4 branches one after another instead of in two threads')
+    parser.add_argument('--standards-catalog', action='store_true',
+                        help='store the standard runs in the standards catalog and use the runs of neighbouring years')
+    parser.add_argument('--read-window', default=None,
+                        help="read the GO files as time ordered windows of this size, e.g. '1mo', to bound the "
+                             "memory used while reading")
+    args = parser.parse_args()
+
+    folders = [get_co2_folder(item, args.data_folder) for item in args.years]
+    read_workers = max(1, (os.cpu_count() or 1) // args.workers)
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        # with the standards catalog the runs of all folders are stored first, so that the runs a folder borrows from
+        # its neighbours do not depend on which folder finishes first
+        if args.standards_catalog:
+            catalog_futures = {executor.submit(run_catalog_folder, folder, args.standards_path, read_workers,
+                                               args.read_window): folder for folder in folders}
+            for future in as_completed(catalog_futures):
+                print(f"{catalog_futures[future]}: {future.result()}")
+
+        futures = [executor.submit(run_folder, folder, args.fb_folder, args.standards_path, args.plots,
+                                   read_workers, args.engine, args.compact,
+                                   args.uncertainty_draws, args.sweep_thresholds,
+                                   not args.segment_coefficients, not args.sequential_gases,
+                                   args.standards_catalog, args.read_window) for folder in folders]
+        for future in as_completed(futures):
+            result = future.result()
+            print(f"{result['folder']}: {result['status']} in {result['seconds']} s {result['error']}")
+            results.append(result)
+
+    df_summary = pd.DataFrame(results).set_index('folder').loc[folders].reset_index()
+    print(df_summary.to_string(index=False))
+    print(f'Total time: {time.perf_counter() - start:.1f} s')
+    filename = f"batch_summary_{datetime.now():%Y%m%d%H%M%S}.txt"
+    df_summary.to_csv(os.path.join(get_data_path(), filename), sep='\t', index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,236 @@
+from dataclasses import dataclass, field
+
 import pandas as pd
 import numpy as np
 
 
+#  method to get the runs where is_std holds as start and (exclusive) end row positions
+def get_standard_runs(is_std: np.ndarray):
+    edges = np.diff(np.concatenate([[0], np.asarray(is_std, dtype=np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+#  method to get the median of the values of every run, ignoring NaN and NaN for runs without values. values is a
+#  (rows x gases) array, all runs and gases are sorted in one pass and the middle values of each run are picked.
+def get_run_medians(values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    lengths = ends - starts
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.intp)
+    run_values = values[np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())]
+    run_id = np.broadcast_to(np.repeat(np.arange(len(starts)), lengths)[:, None], run_values.shape)
+    # sorted by run and by value within the run, NaN last
+    sorted_values = np.take_along_axis(run_values, np.lexsort((run_values, run_id), axis=0), axis=0)
+    counts = np.add.reduceat(~np.isnan(run_values), offsets, axis=0)
+    low = np.take_along_axis(sorted_values, offsets[:, None] + np.maximum(counts - 1, 0) // 2, axis=0)
+    high = np.take_along_axis(sorted_values, offsets[:, None] + counts // 2 - (counts == 0), axis=0)
+    return np.where(counts == 0, np.nan, np.where(counts % 2 == 1, low, (low + high) / 2))
+
+
+# channels of the standard gases, STD1-STD5
+STANDARD_CHANNELS = ['1', '2', '3', '4', '5']
+
+# name, column prefix and unit of the measured gases
+GASES = [('co2', 'CO2', 'ppm'), ('ch4', 'CH4', 'ppb')]
+
+
+#  medians, interpolated and reference values of the standards as (rows x standards) arrays per gas, with the
+#  standards in the order of the standards list
+@dataclass
+class PreparedStandards:
+    standards: list
+    medians: dict = field(default_factory=dict)
+    interpolated: dict = field(default_factory=dict)
+    references: dict = field(default_factory=dict)
+
+    #  method to get the reference and interpolated values of some of the standards as (rows x standards) arrays
+    def get_matrices(self, parameter: str, standards: list):
+        columns = [self.standards.index(item) for item in standards]
+        return self.references[parameter][:, columns], self.interpolated[parameter][:, columns]
+
+    #  method to get the medians of one standard
+    def get_medians(self, parameter: str, standard: str) -> np.ndarray:
+        return self.medians[parameter][:, self.standards.index(standard)]
+
+
+#  method to get the standards found in Type, each distinct Type is checked once
+def get_standards_in_type(df: pd.DataFrame) -> list:
+    types = [str(item) for item in pd.unique(df['Type'].dropna())]
+    return [item for item in STANDARD_CHANNELS if any(item in value for value in types)]
+
+
+#  method to get the median of each run of the given standards and to interpolate the standards between the runs, for
+#  all standards and gases in one pass. The measured values (avg where existing) are built once, the medians of the
+#  runs of all standards are computed together. With write_columns the median_std{n} and interpolated_std{n} columns
+#  are written as well, otherwise the values are only kept in the returned PreparedStandards. anchors holds borrowed
+#  runs before and after the rows, {standard: {gas: (before, after)}}, see standards_catalog.get_neighbour_anchors.
+def prepare_standard_matrices(has_ch4: bool, df: pd.DataFrame, standards: list, write_columns: bool = True,
+                              anchors: dict = None):
+    gases = GASES if has_ch4 else GASES[:1]
+    values = np.column_stack([
+        np.where(df[f'{prefix} avg {unit}'].notna(), df[f'{prefix} avg {unit}'], df[f'{prefix} {unit}'])
+        for _, prefix, unit in gases
+    ]).astype(float)
+    for standard in standards:
+        if f'is_std{standard}' not in df.columns:
+            raise ValueError(f"Column 'is_std{standard}' not found in the DataFrame.")
+    is_std = [df[f'is_std{standard}'].to_numpy(dtype=bool) for standard in standards]
+
+    # medians of the runs of all standards and gases at once
+    runs = [get_standard_runs(item) for item in is_std]
+    starts = np.concatenate([start for start, _ in runs] + [np.empty(0, dtype=np.intp)])
+    ends = np.concatenate([end for _, end in runs] + [np.empty(0, dtype=np.intp)])
+    all_run_medians = get_run_medians(values, starts, ends) if len(starts) else np.empty((0, len(gases)))
+    run_offsets = np.cumsum([0] + [len(start) for start, _ in runs])
+
+    prepared = PreparedStandards(list(standards))
+    for gas, _, _ in gases:
+        prepared.medians[gas] = np.full((len(df), len(standards)), np.nan)
+        prepared.interpolated[gas] = np.full((len(df), len(standards)), np.nan)
+        prepared.references[gas] = np.full((len(df), len(standards)), np.nan)
+
+    elapsed = df['elapsed time (s)'].to_numpy()
+    for s, standard in enumerate(standards):
+        start_indices, end_indices = runs[s]
+        run_medians = all_run_medians[run_offsets[s]:run_offsets[s + 1]]
+        run_id = np.repeat(np.arange(len(start_indices)), end_indices - start_indices)
+        for k, (gas, _, _) in enumerate(gases):
+            medians = prepared.medians[gas][:, s]
+            medians[is_std[s]] = run_medians[run_id, k]
+            references = (df[f'reference_std{standard}_{gas}'].to_numpy(dtype=float)
+                          if f'reference_std{standard}_{gas}' in df.columns else np.full(len(df), np.nan))
+            prepared.references[gas][:, s] = references
+            interpolated = prepared.interpolated[gas][:, s]
+            interpolated[:] = medians
+            before, after = (anchors or {}).get(standard, {}).get(gas, (None, None))
+            if len(start_indices) + (before is not None) + (after is not None) > 1:
+                gap_rows, gap_values = interpolate_gaps(elapsed, start_indices, end_indices, run_medians[:, k],
+                                                        references, before, after)
+                interpolated[gap_rows] = gap_values
+
+        if write_columns:
+            for gas, _, _ in gases:
+                df[f'median_std{standard}_{gas}'] = prepared.medians[gas][:, s]
+            for gas, _, _ in gases:
+                df[f'interpolated_std{standard}_{gas}'] = prepared.interpolated[gas][:, s]
+    return df, prepared
+
+
+#  method to prepare all standards found in Type, see prepare_standard_matrices. Returns the frame and the
+#  PreparedStandards, whose standards are the standards found.
+def prepare_all_standards(has_ch4: bool, df: pd.DataFrame, write_columns: bool = True, anchors: dict = None):
+    return prepare_standard_matrices(has_ch4, df, get_standards_in_type(df), write_columns, anchors)
+
+
+#  method to get the median of each run of a standard and to interpolate the standard between the runs
 def get_median_and_interpolate(has_ch4: bool, df: pd.DataFrame, standard: str):
-    bool_col = f'is_std{standard}'
-    co2_values = df['CO2 ppm'].copy()
-    is_co2_avg = df['CO2 avg ppm'].notna()
-    co2_values.loc[is_co2_avg] = df.loc[is_co2_avg, 'CO2 avg ppm']
-    if has_ch4:
-        ch4_values = df['CH4 ppb'].copy()
-        is_ch4_avg = df['CH4 avg ppb'].notna()
-        ch4_values.loc[is_ch4_avg] = df.loc[is_ch4_avg, 'CH4 avg ppb']
-    if bool_col not in df.columns:
-        raise ValueError(f"Column 'is_std{standard}' not found in the DataFrame.")
-    df[f'median_std{standard}_co2'] = np.nan
-    if has_ch4:
-        df[f'median_std{standard}_ch4'] = np.nan
-    bool_series_diff = df[bool_col].astype(int).diff().fillna(0)
-
-    if df[bool_col].iloc[0] == 1:
-        bool_series_diff.iloc[0] = 1
-
-    if df[bool_col][len(df[bool_col]) - 1] == 1:
-        bool_series_diff[len(df[bool_col])] = -1
-
-    start_indices = bool_series_diff[bool_series_diff == 1].index
-    end_indices = bool_series_diff[bool_series_diff == -1].index
-    for start_idx, end_idx in zip(start_indices, end_indices):
-        temp_values = co2_values.iloc[start_idx:end_idx].values
-        if np.all(np.isnan(temp_values)):
-            median_value = np.nan
-        else:
-            median_value = np.nanmedian(temp_values)
-        df.loc[start_idx:end_idx - 1, f'median_std{standard}_co2'] = median_value
-        if has_ch4:
-            temp_values = ch4_values.iloc[start_idx:end_idx].values
-            if np.all(np.isnan(temp_values)):
-                median_value = np.nan
-            else:
-                median_value = np.nanmedian(temp_values)
-            df.loc[start_idx:end_idx - 1, f'median_std{standard}_ch4'] = median_value
-
-    # interpolate
-    df[f'interpolated_std{standard}_co2'] = np.nan
-    df[f'interpolated_std{standard}_co2'].values[~np.isnan(df[f'median_std{standard}_co2'])] = (
-        df[f'median_std{standard}_co2'].values)[~np.isnan(df[f'median_std{standard}_co2'])]
-    if has_ch4:
-        df[f'interpolated_std{standard}_ch4'] = np.nan
-        df[f'interpolated_std{standard}_ch4'].values[~np.isnan(df[f'median_std{standard}_ch4'])] = (
-            df[f'median_std{standard}_ch4'].values)[~np.isnan(df[f'median_std{standard}_ch4'])]
-
-    # CO2
-    for i in range(len(start_indices) - 1):
-        gap_between_std_curves = (
-                                         df.loc[start_indices[i + 1], 'elapsed time (s)']
-                                         - df.loc[end_indices[i] - 1, 'elapsed time (s)']
-        ) > 12 * 3600
-        bool_gap_between_std_curves = ((df['elapsed time (s)'] > df.loc[end_indices[i] - 1, 'elapsed time (s)']) &
-                  (df['elapsed time (s)'] <= df.loc[end_indices[i] - 1, 'elapsed time (s)'] + 12 * 3600))
-        if gap_between_std_curves:
-            df.loc[bool_gap_between_std_curves, f'interpolated_std{standard}_co2'] = df.loc[
-                end_indices[i] - 1, f'median_std{standard}_co2']
-        elif (df.loc[start_indices[i + 1], f'reference_std{standard}_co2'] ==
-              df.loc[end_indices[i] - 1, f'reference_std{standard}_co2']):
-            df.loc[end_indices[i]:start_indices[i + 1] - 1, f'interpolated_std{standard}_co2'] = \
-                (np.interp(df.loc[end_indices[i]:start_indices[i + 1] - 1, 'elapsed time (s)'].values,
-                           df.loc[[end_indices[i] - 1, start_indices[i + 1]], 'elapsed time (s)'].values,
-                           df.loc[[end_indices[i] - 1, start_indices[i + 1]], f'median_std{standard}_co2'].values))
-        else:
-            df.loc[end_indices[i]:start_indices[i + 1] - 1, f'interpolated_std{standard}_co2'] = df.loc[
-                end_indices[i] - 1, f'median_std{standard}_co2']
-        # CH4
-        if has_ch4:
-            if gap_between_std_curves:
-                df.loc[bool_gap_between_std_curves, f'interpolated_std{standard}_ch4'] = df.loc[
-                    end_indices[i] - 1, f'median_std{standard}_ch4']
-            elif (df.loc[start_indices[i + 1], f'reference_std{standard}_ch4'] ==
-                  df.loc[end_indices[i] - 1, f'reference_std{standard}_ch4']):
-                df.loc[end_indices[i]:start_indices[i + 1] - 1, f'interpolated_std{standard}_ch4'] = \
-                    (np.interp(df.loc[end_indices[i]:start_indices[i + 1] - 1, 'elapsed time (s)'].values,
-                               df.loc[[end_indices[i] - 1, start_indices[i + 1]], 'elapsed time (s)'].values,
-                               df.loc[
-                                   [end_indices[i] - 1, start_indices[i + 1]], f'median_std{standard}_ch4'].values))
-            else:
-                df.loc[end_indices[i]:start_indices[i + 1] - 1, f'interpolated_std{standard}_ch4'] = df.loc[
-                    end_indices[i] - 1, f'median_std{standard}_ch4']
-    return df
+    return prepare_standard_matrices(has_ch4, df, [standard])[0]
+
 
+#  method to interpolate the medians of a standard over the gaps between consecutive runs, returns the rows of the gaps
+#  and their values. The rows are sorted by elapsed time. For every gap the anchors are the end of the run before and
+#  the start of the run after:
+#  - a gap longer than 12 hours holds the median of the run before for at most 12 hours and is NaN after that
+#  - otherwise, if both anchors have the same reference value the medians are interpolated linearly
+#  - otherwise the median of the run before is held until the next run
+#  before and after are optional (elapsed time, median, reference) anchors of runs outside the rows, e.g. from the
+#  standards catalog, that give the rows before the first and after the last run a gap of their own.
+#  All interpolated gaps are filled with one np.interp call on the anchors of these gaps.
+def interpolate_gaps(elapsed: np.ndarray, start_indices: np.ndarray, end_indices: np.ndarray,
+                     run_medians: np.ndarray, references: np.ndarray, before: tuple = None, after: tuple = None):
+    # row range, times, median and references of every anchor, borrowed anchors have an empty row range
+    row_start, row_end = start_indices, end_indices
+    x_start, x_end = elapsed[start_indices], elapsed[end_indices - 1]
+    medians = run_medians
+    reference_start, reference_end = references[start_indices], references[end_indices - 1]
+    for anchor, is_before in [(before, True), (after, False)]:
+        if anchor is not None:
+            # the position of the anchor after is taken once the anchor before is inserted
+            position, row = (0, 0) if is_before else (len(row_start), len(elapsed))
+            x_anchor, median, reference = anchor
+            row_start, row_end = np.insert(row_start, position, row), np.insert(row_end, position, row)
+            x_start, x_end = np.insert(x_start, position, x_anchor), np.insert(x_end, position, x_anchor)
+            medians = np.insert(medians, position, median)
+            reference_start = np.insert(reference_start, position, reference)
+            reference_end = np.insert(reference_end, position, reference)
 
+    gap_starts = row_end[:-1]
+    lengths = row_start[1:] - gap_starts
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.intp)
+    gap = np.repeat(np.arange(len(lengths)), lengths)
+    rows = np.repeat(gap_starts - offsets, lengths) + np.arange(lengths.sum())
+    x = elapsed[rows]
+
+    # anchors and rules of each gap
+    x0 = x_end[:-1]
+    x1 = x_start[1:]
+    y0 = medians[:-1]
+    y1 = medians[1:]
+    is_long = x1 - x0 > 12 * 3600
+    is_linear = ~is_long & (reference_start[1:] == reference_end[:-1])
+
+    values = np.where(is_long[gap] & ((x <= x0[gap]) | (x > x0[gap] + 12 * 3600)), np.nan, y0[gap])
+    is_linear_row = is_linear[gap]
+    if is_linear_row.any():
+        xp = np.column_stack([x0[is_linear], x1[is_linear]]).ravel()
+        fp = np.column_stack([y0[is_linear], y1[is_linear]]).ravel()
+        linear = np.interp(x[is_linear_row], xp, fp)
+        # rows at an anchor get the value of that anchor, as when each gap is interpolated on its own
+        g = gap[is_linear_row]
+        x_linear = x[is_linear_row]
+        linear = np.where((x_linear == x0[g]) & (x0[g] != x1[g]), y0[g], linear)
+        linear = np.where(x_linear == x1[g], y1[g], linear)
+        values[is_linear_row] = linear
+    return rows, values
+
+
+#  method to get the cylinder periods of the same STD channel that overlap in the standards sheet, as pairs of sheet
+#  rows with the overlapping time span. Where periods overlap the later row of the sheet is used.
+def get_overlapping_periods(df_stds: pd.DataFrame) -> pd.DataFrame:
+    overlaps = []
+    channels = df_stds['STD channel'].astype(str)
+    for channel in channels.unique():
+        periods = df_stds.loc[(channels == channel).to_numpy(), ['Start time series', 'End time series']].dropna()
+        periods = periods.sort_values('Start time series', kind='stable')
+        # the period ending last among the earlier starts is the one a later period can overlap
+        latest, latest_end = None, None
+        for row, start, end in zip(periods.index, periods['Start time series'], periods['End time series']):
+            if latest is not None and start <= latest_end:
+                overlaps.append({'STD channel': channel, 'first row': latest, 'second row': row,
+                                 'overlap start': start, 'overlap end': min(end, latest_end)})
+            if latest is None or end > latest_end:
+                latest, latest_end = row, end
+    return pd.DataFrame(overlaps, columns=['STD channel', 'first row', 'second row', 'overlap start', 'overlap end'])
+
+
+#  method to set the certified values of the standards, reference_std{n}_co2 and _ch4, for the rows within the
+#  validity period of each cylinder. The periods are found with searchsorted on the sorted times, one slice per
+#  cylinder, in the order of the standards sheet so that a later row wins where periods overlap.
 def get_standard_reference_value(has_ch4: bool, df: pd.DataFrame, df_stds: pd.DataFrame):
-    for _, row in df_stds.iterrows():
-        standard = str(row['STD channel'])
-        if df['Type'].str.contains(standard).any():
-            if f'reference_{standard.lower()}_co2' not in df.columns:
-                df[f'reference_{standard.lower()}_co2'] = np.nan
-            if f'reference_{standard.lower()}_ch4' not in df.columns and has_ch4:
-                df[f'reference_{standard.lower()}_ch4'] = np.nan
-            co2_value = row['CO2 ppm']
-            ch4_value = row['CH4 ppb']
-            start_time = row['Start time series']
-            end_time = row['End time series']
-            bool_ref = (
-                    (df['time series'] >= start_time) &
-                    (df['time series'] <= end_time)
-            )
-            df.loc[bool_ref, f'reference_{standard.lower()}_co2'] = co2_value
-            if has_ch4:
-                df.loc[bool_ref, f'reference_{standard.lower()}_ch4'] = ch4_value
+    df_overlaps = get_overlapping_periods(df_stds)
+    if len(df_overlaps):
+        print('Overlapping standard periods, the later row of the standards sheet is used')
+        print(df_overlaps.to_string(index=False))
+
+    times = df['time series']
+    order = None if times.is_monotonic_increasing else np.argsort(times.to_numpy(), kind='stable')
+    sorted_times = pd.Index(times if order is None else times.iloc[order])
+    gases = [('co2', 'CO2 ppm'), ('ch4', 'CH4 ppb')] if has_ch4 else [('co2', 'CO2 ppm')]
+
+    channels = df_stds['STD channel'].astype(str)
+    for channel in channels.unique():
+        if not df['Type'].str.contains(channel).any():
+            continue
+        cylinders = df_stds[(channels == channel).to_numpy()]
+        cylinders = cylinders[cylinders['Start time series'].notna() & cylinders['End time series'].notna()]
+        starts = sorted_times.searchsorted(cylinders['Start time series'], 'left')
+        ends = sorted_times.searchsorted(cylinders['End time series'], 'right')
+        for gas, value_col in gases:
+            col = f'reference_{channel.lower()}_{gas}'
+            values = np.full(len(df), np.nan) if col not in df.columns else df[col].to_numpy(dtype=float).copy()
+            if order is not None:
+                values = values[order]
+            for start, end, value in zip(starts, ends, cylinders[value_col].to_numpy(dtype=float)):
+                values[start:end] = value
+            if order is not None:
+                values[order] = values.copy()
+            df[col] = values
     return df
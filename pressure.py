@@ -0,0 +1,78 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+
+
+# constants of the pressure sensor on the ship
+@dataclass(frozen=True)
+class StationConfig:
+    height: int = 27  # m, height of the pressure sensor above sea level
+    qff_calculated_from: datetime = datetime(2023, 1, 1, 0, 0, 0)  # before this the QFF of the ferrybox is used
+
+    #  method to get qff_calculated_from for comparing with datetime64 arrays
+    @property
+    def qff_calculated_from_datetime64(self) -> np.datetime64:
+        return np.datetime64(self.qff_calculated_from)
+
+
+#  method to get the station constants, created once per process
+@lru_cache(maxsize=None)
+def get_station_config() -> StationConfig:
+    return StationConfig()
+
+
+#  method to calculate QFF from plain arrays (or scalars) in one pass, the function used by SMHI. Missing latitudes are
+#  taken as 60° and missing temperatures as 15 °C, pressures outside 600-1100 hPa give NaN.
+def qff_kernel(temperature_c, latitude, height: int, pressure) -> np.ndarray:
+    #  QFF: the air pressure at the monitoring station reduced to sea level, typically using local temperature
+    #  observations (e.g. use "Air_temperature"). This is in contrast to QNH, which is the sea level pressure calculated
+    #  assuming a standard atmosphere.
+    temperature_c = np.asarray(temperature_c, dtype=float)
+    latitude = np.asarray(latitude, dtype=float)
+    pressure = np.asarray(pressure, dtype=float)
+    latitude = np.where(np.isnan(latitude), 60, latitude)
+    temperature_c = np.where(np.isnan(temperature_c), 15, temperature_c)
+
+    valid_pressure = (pressure >= 600) & (pressure <= 1100)
+    b = 3.4163 * (1 - 0.0026373 * np.cos(2 * latitude * math.pi)) / 100
+    t1 = np.select([temperature_c < -7, temperature_c < 2],
+                   [temperature_c * 0.5 + 275.0, temperature_c * 0.535 + 275.6],
+                   temperature_c * 1.07 + 274.5)
+    with np.errstate(over='ignore', divide='ignore', invalid='ignore'):
+        return np.where(valid_pressure, pressure * np.exp(height * b / t1), np.nan)
+
+
+#  method to select the QFF of each row: the QFF of the ferrybox before the switch in the station config, otherwise
+#  QFF calculated from the atmospheric pressure, air temperature and latitude, NaN where neither is valid
+def select_qff(time, qff_ferrybox, qf_qff, qf_atm_pressure, qf_air_temperature, qf_latitude, air_temperature,
+               latitude, atm_pressure, config: StationConfig = None) -> np.ndarray:
+    config = config or get_station_config()
+    is_ferrybox = (np.asarray(time) < config.qff_calculated_from_datetime64) & np.asarray(qf_qff, dtype=bool)
+    is_calculated = (~is_ferrybox & np.asarray(qf_atm_pressure, dtype=bool) &
+                     np.asarray(qf_air_temperature, dtype=bool) & (np.asarray(qf_latitude) < 3))
+    return np.select([is_ferrybox, is_calculated],
+                     [np.asarray(qff_ferrybox, dtype=float),
+                      qff_kernel(air_temperature, latitude, config.height, atm_pressure)],
+                     np.nan)
+
+
+#  method to calculate the equilibrator pressure and the atmospheric pressure at sea level in atm from plain arrays
+#  (or scalars). The equilibrator pressure is the lab pressure, or the licor pressure without lab pressure, plus the
+#  equilibrator differential pressure, and QFF where neither is available.
+def p_equ_kernel(lab_press, licor_press, equ_press, qff, qf_lab_press, qf_licor_press, qf_equ_press) -> dict:
+    lab_press = np.asarray(lab_press, dtype=float)
+    licor_press = np.asarray(licor_press, dtype=float)
+    equ_press = np.asarray(equ_press, dtype=float)
+    qff = np.asarray(qff, dtype=float)
+    qf_equ_press = np.asarray(qf_equ_press, dtype=bool)
+
+    is_lab = ~np.isnan(lab_press) & np.asarray(qf_lab_press, dtype=bool) & qf_equ_press
+    is_licor = ~np.isnan(licor_press) & np.isnan(lab_press) & np.asarray(qf_licor_press, dtype=bool) & qf_equ_press
+    p_equ = np.select([is_lab, is_licor], [(lab_press + equ_press) / 1013.25, (licor_press + equ_press) / 1013.25],
+                      np.nan)
+    p_equ_is_from_qff = np.isnan(p_equ) & ~np.isnan(qff)
+    p_equ = np.where(p_equ_is_from_qff, qff / 1013.25, p_equ)
+    return {'P_equ': p_equ, 'P_equ_is_from_QFF': p_equ_is_from_qff, 'P_atm_sea': qff / 1013.25}
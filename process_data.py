@@ -1,178 +1,342 @@
+import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pandas as pd
 
 from file_reader import (list_files, list_ferrybox_files, read_files_dynamic, read_standards,
-                         read_ferrybox_files_dynamic, merge_go_and_ferrybox)
+                         read_ferrybox_files_dynamic, merge_go_and_ferrybox_polars)
+from ferrybox_catalog import get_ferrybox_catalog_path
+from ferrybox_store import get_ferrybox_store_path
+from ingest_cache import get_ingest_cache_path
 from plot_co2_ch4_data import (plot_ship_track, plot_housekeeping_parameters, plot_standards,
                            plot_fco2_in_situ, plot_intercept_slope, plot_ch4_in_situ)
 from flag import get_type_flags, geographic_check, range_check, constant_value, outlier_check, gradient_check, geographic_check
-from prepare_standards import get_median_and_interpolate, get_standard_reference_value
-from calculations import (correct_based_on_standards, get_qff, get_delta_temperature, calculate_pco2_dry,
-                          calculate_ph2o_equ_atm, calculate_pco2_wet, calculate_fco2_wet, calculate_pco2_fco2_in_situ,
+from prepare_standards import PreparedStandards, prepare_all_standards, get_standard_reference_value
+from calculations import (correct_based_on_standards, sweep_calibration_thresholds, get_qff, get_delta_temperature,
+                          compute_p_equ_p_atm,
+                          calculate_pco2_dry, calculate_ph2o_equ_atm, calculate_pco2_wet, calculate_fco2_wet, calculate_pco2_fco2_in_situ,
                           calculate_pch4_dry, calculate_pch4_wet, calculate_ch4_nmol_kg_and_pch4_in_situ)
-from export_results import export_fco2_ch4, export_ferrybox_with_fco2_ch4
-
-# directory for CO2 files
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2012\all_dat_files_2012'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2013\all_dat_files_2013'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2014\all_dat_files_2014'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2017\all_dat_files_2017'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2018\all_dat_files_2018'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2019\Leak'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2019'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2020'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2021'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2022'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2023'
-co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2024'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2025'
-# co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2026'
-
-# list files in folder
-co2_files = list_files(co2_folder)
-
-# read co2 files in folder
-df, df_extra = read_files_dynamic(co2_files)
-
-# get start and end dates
-if df.shape[0] > 0:
-    start_time = df["time series"].item(0)
-    start_date = f"{start_time.year}{start_time.month:02d}{start_time.day:02d}"
-    end_time = df["time series"].item(-1)
-    end_date = f"{end_time.year}{end_time.month:02d}{end_time.day:02d}"
-else:
-    sys.exit("Ingen data")
-
-has_ch4 = df["CH4 ppb"].is_not_null().any()
+from calculations_polars import calculate_co2_chain_polars, calculate_ch4_chain_polars
+from calibration_model import build_calibration_model
+from standards_catalog import (get_standards_catalog_path, get_neighbour_anchors, get_catalog_runs,
+                               update_standards_catalog)
+from compact_frame import compact_frame, combine_flags, get_flag
+from uncertainty import add_uncertainty
+from export_results import export_fco2_ch4, export_ferrybox_with_fco2_ch4, export_threshold_sweep
 
 # directory for ferrybox files
-fb_folder = r'\\Winfs\data\prod\Obs_Oceanografi\Arkiv\Ferrybox\txt'
-
-# list ferrybox files
-fb_list = list_ferrybox_files(fb_folder, start_time, end_time)
-
-# read ferrybox files
-df_fb = read_ferrybox_files_dynamic(fb_list)
-
-# merge ferrybox with co2 data
-df = df.to_pandas()
-df_fb = df_fb.to_pandas()
-df = merge_go_and_ferrybox(df, df_fb)
-df = get_qff(df)
-df = get_delta_temperature(df)
-
-# flag Type
-df = get_type_flags(df)
-
-# get quality flags for GO system: range check, constant value, outlier and gradient check
-df = geographic_check(df)
-df = range_check(df, has_ch4)
-df = constant_value(df, has_ch4)
-df = outlier_check(df, has_ch4)
-df = gradient_check(df, has_ch4)
-
-# update flags for added ferrybox properties used in calculations
-df['QF SST'] = df['QF SST'] < 3
-df['QF SSS'] = df['QF SSS'] < 3
-df['QF QFF'] = df['QF QFF'] < 3
-df['QF Atm_pressure'] = df['QF Atm_pressure'] < 3
-df['QF Air_temperature'] = df['QF Air_temperature'] < 3
-
-# plot ship track
-plot_ship_track(df, start_date, end_date)
-
-# plot housekeeping parameters
-plot_housekeeping_parameters(df, start_date, end_date)
-
-# read certified standard gases
-standards_path = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\Standard gases\Standard_gases.xlsx'
-df_stds = read_standards(standards_path)
-df = get_standard_reference_value(has_ch4, df, df_stds)
-standards = []
-for item in ['1', '2', '3', '4', '5']:
-    if df['Type'].str.contains(item).any():
-        df = get_median_and_interpolate(has_ch4, df, item)
-        standards.append(item)
-
-# plot standards
-plot_standards(df, start_date, end_date)
-
-# correct measurements using standards
-# define calibration and standard threshold, i.e. acceptable limits for how much calibrated values may differ from
-# measured values and how much the reference standard values may differ from measured values.
-
-# co2
-# to get data from 2025 a limit of 20 ppm is necessary for the period Jan-Apr... this is a highly questionable limit...
-# QuinCe limit is 4 ppm, default here is set to 10 ppm.
-df = correct_based_on_standards("CO2", "ppm", df, standards, start_time, 10, 10)
-plot_intercept_slope("co2", df, start_date, end_date)
-
-# calculate vapour pressure for equ and atm
-is_valid_equ = df['QF period'] & df['QF licor flow'] & df['QF H2O flow'] & df['QF ocean']
-is_valid_atm = df['QF period'] & df['QF licor flow']
-df = calculate_ph2o_equ_atm(
-    df,
-    is_valid_equ & df['QF equ temp'] & df['QF SSS'],
-    is_valid_atm & df['QF SSS'] & df['QF SST']
-)
-
-# calculate partial pressure of co2 for dry air
-is_valid_equ_co2 = df['QF xco2_cal'] & is_valid_equ
-is_valid_atm_co2 = df['QF xco2_cal'] & is_valid_atm
-df = calculate_pco2_dry(df, is_valid_equ_co2, is_valid_atm_co2)
-
-# calculate partial pressure of co2 for wet air
-is_valid_equ_co2 &= df['QF equ temp'] & df['QF SSS']
-is_valid_atm_co2 &= df['QF SSS'] & df['QF SST']
-df = calculate_pco2_wet(df, is_valid_equ_co2, is_valid_atm_co2)
-
-# calculate fugacity of co2 for wet air
-df = calculate_fco2_wet(df, is_valid_equ_co2, is_valid_atm_co2)
-
-# calculate fugacity of co2 for wet air at sea surface temperature
-is_valid_equ_co2 &= df['QF SST']
-df = calculate_pco2_fco2_in_situ(df, is_valid_equ_co2)
-
-# plot fco2 wet at in situ temperature together with in situ temperature and salinity
-plot_fco2_in_situ(df, start_date, end_date)
-
-# methane
-if has_ch4:
+FB_FOLDER = r'\\Winfs\data\prod\Obs_Oceanografi\Arkiv\Ferrybox\txt'
+
+# certified standard gases
+STANDARDS_PATH = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\Standard gases\Standard_gases.xlsx'
+
+
+#  method to calibrate co2 and calculate ph2o, pco2 and fco2, returns the frame and the threshold sweep (None without
+#  sweep_thresholds). pressures are the pressures of compute_p_equ_p_atm shared with the ch4 branch.
+def process_co2(df: pd.DataFrame, standards: list, start_time: datetime, is_valid_equ: pd.Series,
+                is_valid_atm: pd.Series, engine: str = 'pandas', expand_coefficients: bool = True,
+                sweep_thresholds: bool = False, prepared: PreparedStandards = None, pressures: dict = None):
+    # to get data from 2025 a limit of 20 ppm is necessary for the period Jan-Apr... this is a highly questionable limit...
+    # QuinCe limit is 4 ppm, default here is set to 10 ppm.
+    df = correct_based_on_standards("CO2", "ppm", df, standards, start_time, 10, 10, expand_coefficients, prepared)
+    df_sweep = (sweep_calibration_thresholds("CO2", "ppm", df, standards, start_time, prepared=prepared)
+                if sweep_thresholds else None)
+
+    if engine == 'polars':
+        # ph2o, pco2 and fco2 in one fused pass
+        return calculate_co2_chain_polars(df, is_valid_equ, is_valid_atm, pressures), df_sweep
+
+    # calculate vapour pressure for equ and atm
+    df = calculate_ph2o_equ_atm(
+        df,
+        is_valid_equ & combine_flags(df, ['QF equ temp', 'QF SSS']),
+        is_valid_atm & combine_flags(df, ['QF SSS', 'QF SST'])
+    )
+
+    # calculate partial pressure of co2 for dry air
+    is_valid_equ_co2 = get_flag(df, 'QF xco2_cal') & is_valid_equ
+    is_valid_atm_co2 = get_flag(df, 'QF xco2_cal') & is_valid_atm
+    df = calculate_pco2_dry(df, is_valid_equ_co2, is_valid_atm_co2, pressures)
+
+    # calculate partial pressure of co2 for wet air
+    is_valid_equ_co2 &= combine_flags(df, ['QF equ temp', 'QF SSS'])
+    is_valid_atm_co2 &= combine_flags(df, ['QF SSS', 'QF SST'])
+    df = calculate_pco2_wet(df, is_valid_equ_co2, is_valid_atm_co2)
+
+    # calculate fugacity of co2 for wet air
+    df = calculate_fco2_wet(df, is_valid_equ_co2, is_valid_atm_co2)
+
+    # calculate fugacity of co2 for wet air at sea surface temperature
+    is_valid_equ_co2 &= get_flag(df, 'QF SST')
+    return calculate_pco2_fco2_in_situ(df, is_valid_equ_co2), df_sweep
+
+
+#  method to calibrate ch4 and calculate pch4, the dissolved concentration and pch4 in situ, returns the frame and the
+#  threshold sweep (None without sweep_thresholds). ph2o is calculated as in the co2 branch if it is missing, so the
+#  branch does not wait for the co2 branch. pressures as in process_co2.
+def process_ch4(df: pd.DataFrame, standards: list, start_time: datetime, is_valid_equ: pd.Series,
+                is_valid_atm: pd.Series, engine: str = 'pandas', expand_coefficients: bool = True,
+                sweep_thresholds: bool = False, prepared: PreparedStandards = None, pressures: dict = None):
     # correct data using standards
-    df = correct_based_on_standards("CH4", "ppb", df, standards, start_time, 20, 20)
-    plot_intercept_slope("ch4", df, start_date, end_date)
+    df = correct_based_on_standards("CH4", "ppb", df, standards, start_time, 20, 20, expand_coefficients, prepared)
+    df_sweep = (sweep_calibration_thresholds("CH4", "ppb", df, standards, start_time, (5, 10, 15, 20, 30, 40),
+                                             (5, 10, 15, 20, 30, 40), prepared) if sweep_thresholds else None)
 
-    is_valid_equ_ch4 = df['QF xch4_cal'] & is_valid_equ
-    is_valid_atm_ch4 = df['QF xch4_cal'] & is_valid_atm
+    if engine == 'polars':
+        # pch4, concentration and pch4 in situ in one fused pass
+        return calculate_ch4_chain_polars(df, is_valid_equ, is_valid_atm, pressures), df_sweep
+
+    if 'ph2o' not in df.columns:
+        df = calculate_ph2o_equ_atm(
+            df,
+            is_valid_equ & combine_flags(df, ['QF equ temp', 'QF SSS']),
+            is_valid_atm & combine_flags(df, ['QF SSS', 'QF SST'])
+        )
+
+    is_valid_equ_ch4 = get_flag(df, 'QF xch4_cal') & is_valid_equ
+    is_valid_atm_ch4 = get_flag(df, 'QF xch4_cal') & is_valid_atm
 
     # calculate partial pressure of ch4 for dry air
-    df = calculate_pch4_dry(df, is_valid_equ_ch4, is_valid_atm_ch4)
+    df = calculate_pch4_dry(df, is_valid_equ_ch4, is_valid_atm_ch4, pressures)
 
-    is_valid_equ_ch4 &= df['QF equ temp'] & df['QF SSS']
-    is_valid_atm_ch4 &= df['QF SSS'] & df['QF SST']
+    is_valid_equ_ch4 &= combine_flags(df, ['QF equ temp', 'QF SSS'])
+    is_valid_atm_ch4 &= combine_flags(df, ['QF SSS', 'QF SST'])
 
     # calculate partial pressure wet air
     df = calculate_pch4_wet(df, is_valid_equ_ch4, is_valid_atm_ch4)
 
     # calculate dissolved CH4 concentration and surface water partial pressure (in situ)
-    is_valid_equ_ch4 &= df['QF SST']
-    df = calculate_ch4_nmol_kg_and_pch4_in_situ(df, is_valid_equ_ch4)
-
-    # plot concentration and pCH4 wet at in situ temperature,
-    # together with in situ temperature and salinity
-    plot_ch4_in_situ(df, start_date, end_date)
-
-# export carbon data
-export_fco2_ch4(df, start_date, end_date, has_ch4)
-
-# export ferrybox data
-start_t = df_fb["Time_series"].iloc[0]
-start_str = f"{start_t.year}{start_t.month:02d}{start_t.day:02d}"
-end_t = df_fb["Time_series"].iloc[-1]
-end_str= f"{end_t.year}{end_t.month:02d}{end_t.day:02d}"
-export_ferrybox_with_fco2_ch4(df, df_fb, start_str, end_str, has_ch4)
-
-
-
-
-
+    is_valid_equ_ch4 &= get_flag(df, 'QF SST')
+    return calculate_ch4_nmol_kg_and_pch4_in_situ(df, is_valid_equ_ch4), df_sweep
+
+
+#  method to store the standard runs of one folder of GO files in the standards catalog without calibrating, returns
+#  the number of runs stored. The runs only depend on the GO data and the standards sheet, so main.py fills the
+#  catalog for all folders with this before any folder reads the runs of its neighbours in process_folder.
+def catalog_folder_standards(co2_folder: str,
+                             standards_path: str = STANDARDS_PATH,
+                             read_workers: int = os.cpu_count() or 1,
+                             read_window: str = None):
+    df, _ = read_files_dynamic(list_files(co2_folder), workers=read_workers, cache_folder=get_ingest_cache_path(),
+                               skip_overlapping=True, window=read_window)
+    if df.shape[0] == 0:
+        return 0
+    start_time = df["time series"].item(0)
+    end_time = df["time series"].item(-1)
+    has_ch4 = df["CH4 ppb"].is_not_null().any()
+
+    df = get_type_flags(df.to_pandas())
+    df = get_standard_reference_value(has_ch4, df, read_standards(standards_path))
+    df, prepared = prepare_all_standards(has_ch4, df, write_columns=False)
+    df_runs = get_catalog_runs(df, prepared)
+    update_standards_catalog(get_standards_catalog_path(), df_runs, start_time, end_time)
+    return df_runs.height
+
+
+#  method to run the full pipeline for one folder of GO files, returns None if the folder holds no data.
+#  engine selects how the co2 and ch4 calculation chains are run, 'pandas' step by step or 'polars' as one fused plan.
+#  With compact the working frame is made smaller after the standards are prepared, see compact_frame, and the returned
+#  frame holds the QF and is_ flags packed, use get_flag or expand_flags to read them. The medians and interpolated
+#  values of the standards are then only kept as arrays, without median_std and interpolated_std columns. With
+#  uncertainty_draws the uncertainty of the in situ values is estimated with that many Monte Carlo draws per row and
+#  exported as percentiles.
+#  With sweep_thresholds the retained rows for a grid of calibration and standard thresholds are printed and exported.
+#  Without expand_coefficients the calibration coefficients are not written per row, they are plotted at the start of
+#  each segment of the calibration model.
+#  With concurrent_gases the co2 and ch4 branches are run in two threads. With standards_catalog the standard runs
+#  are stored in the persistent standards catalog and the runs of neighbouring periods are used at the start and end.
+#  With read_window, e.g. '1mo', the GO files are read as time ordered windows of that size, so that only the raw
+#  data of one window is held while reading. The windows are concatenated before processing, so the memory of the
+#  processing steps still grows with the folder.
+def process_folder(co2_folder: str,
+                   fb_folder: str = FB_FOLDER,
+                   standards_path: str = STANDARDS_PATH,
+                   plot: bool = True,
+                   read_workers: int = os.cpu_count() or 1,
+                   engine: str = 'pandas',
+                   compact: bool = False,
+                   uncertainty_draws: int = 0,
+                   sweep_thresholds: bool = False,
+                   expand_coefficients: bool = True,
+                   concurrent_gases: bool = True,
+                   standards_catalog: bool = False,
+                   read_window: str = None):
+    if engine not in ('pandas', 'polars'):
+        raise ValueError(f"Unknown engine '{engine}', use 'pandas' or 'polars'")
+
+    # list files in folder
+    co2_files = list_files(co2_folder)
+
+    # read co2 files in folder, parsing new or changed files in parallel and the rest from the local ingest cache
+    df, df_extra = read_files_dynamic(co2_files, workers=read_workers, cache_folder=get_ingest_cache_path(),
+                                       skip_overlapping=True, window=read_window)
+
+    # get start and end dates
+    if df.shape[0] == 0:
+        print("Ingen data")
+        return None
+    start_time = df["time series"].item(0)
+    start_date = f"{start_time.year}{start_time.month:02d}{start_time.day:02d}"
+    end_time = df["time series"].item(-1)
+    end_date = f"{end_time.year}{end_time.month:02d}{end_time.day:02d}"
 
+    has_ch4 = df["CH4 ppb"].is_not_null().any()
+
+    # the calibration model is keyed on time and can not reproduce the per row coefficients of rows sharing a time
+    # stamp, see calibration_model.get_standard_knots, so such periods keep the per row coefficients
+    if not expand_coefficients and df["time series"].is_duplicated().any():
+        print("Duplicated time stamps, the calibration coefficients are written per row")
+        expand_coefficients = True
+
+    # list ferrybox files using the persistent ferrybox catalog
+    fb_list = list_ferrybox_files(fb_folder, start_time, end_time, get_ferrybox_catalog_path())
+
+    # read ferrybox files, converting new files once into the local month partitioned ferrybox store. The listed files
+    # are read as a whole, so the ferrybox export covers the same period as the files.
+    df_fb = read_ferrybox_files_dynamic(fb_list, get_ferrybox_store_path())
+
+    # merge ferrybox with co2 data
+    df = merge_go_and_ferrybox_polars(df, df_fb).to_pandas()
+    df_fb = df_fb.to_pandas()
+    df = get_qff(df)
+    df = get_delta_temperature(df)
+
+    # flag Type
+    df = get_type_flags(df)
+
+    # get quality flags for GO system: range check, constant value, outlier and gradient check
+    df = geographic_check(df)
+    df = range_check(df, has_ch4)
+    df = constant_value(df, has_ch4)
+    df = outlier_check(df, has_ch4)
+    df = gradient_check(df, has_ch4)
+
+    # update flags for added ferrybox properties used in calculations
+    df['QF SST'] = df['QF SST'] < 3
+    df['QF SSS'] = df['QF SSS'] < 3
+    df['QF QFF'] = df['QF QFF'] < 3
+    df['QF Atm_pressure'] = df['QF Atm_pressure'] < 3
+    df['QF Air_temperature'] = df['QF Air_temperature'] < 3
+
+    # plot ship track
+    if plot:
+        plot_ship_track(df, start_date, end_date)
+
+    # plot housekeeping parameters
+    if plot:
+        plot_housekeeping_parameters(df, start_date, end_date)
+
+    # read certified standard gases
+    df_stds = read_standards(standards_path)
+    df = get_standard_reference_value(has_ch4, df, df_stds)
+    # medians and interpolated values of all standards and gases in one pass, kept as (rows x standards) arrays. The
+    # compact frame does not get the median_std and interpolated_std columns.
+    # with the standards catalog the rows before the first and after the last run of each standard are interpolated
+    # to the nearest runs of the neighbouring periods, and the runs of this period are stored for later periods
+    anchors = get_neighbour_anchors(df, get_standards_catalog_path(), has_ch4) if standards_catalog else None
+    df, prepared = prepare_all_standards(has_ch4, df, write_columns=not compact, anchors=anchors)
+    standards = prepared.standards
+    if standards_catalog:
+        update_standards_catalog(get_standards_catalog_path(), get_catalog_runs(df, prepared), start_time, end_time)
+
+    # plot standards
+    if plot:
+        plot_standards(df, start_date, end_date)
+
+    # categorical Type, packed flags and float32 housekeeping channels for the rest of the pipeline
+    if compact:
+        df = compact_frame(df)
+
+    # correct measurements using standards
+    # define calibration and standard threshold, i.e. acceptable limits for how much calibrated values may differ from
+    # measured values and how much the reference standard values may differ from measured values.
+    is_valid_equ = combine_flags(df, ['QF period', 'QF licor flow', 'QF H2O flow', 'QF ocean'])
+    is_valid_atm = combine_flags(df, ['QF period', 'QF licor flow'])
+    # equilibrator and atmospheric pressures, computed once for both branches
+    pressures = compute_p_equ_p_atm(df)
+    if has_ch4 and concurrent_gases:
+        # the co2 and ch4 branches only read the common columns and write their own columns, run them on shallow
+        # copies at the same time and add the ch4 columns to the co2 frame in the order of a sequential run
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            future_co2 = executor.submit(process_co2, df.copy(deep=False), standards, start_time, is_valid_equ,
+                                         is_valid_atm, engine, expand_coefficients, sweep_thresholds, prepared,
+                                         pressures)
+            future_ch4 = executor.submit(process_ch4, df.copy(deep=False), standards, start_time, is_valid_equ,
+                                         is_valid_atm, engine, expand_coefficients, sweep_thresholds, prepared,
+                                         pressures)
+            df, df_sweep_co2 = future_co2.result()
+            df_ch4, df_sweep_ch4 = future_ch4.result()
+        for col in df_ch4.columns:
+            if col not in df.columns:
+                df[col] = df_ch4[col]
+    else:
+        df, df_sweep_co2 = process_co2(df, standards, start_time, is_valid_equ, is_valid_atm, engine,
+                                       expand_coefficients, sweep_thresholds, prepared, pressures)
+        if has_ch4:
+            df, df_sweep_ch4 = process_ch4(df, standards, start_time, is_valid_equ, is_valid_atm, engine,
+                                           expand_coefficients, sweep_thresholds, prepared, pressures)
+
+    # co2
+    if sweep_thresholds:
+        print(df_sweep_co2.to_string(index=False))
+        export_threshold_sweep(df_sweep_co2, "CO2", start_date, end_date)
+    if plot:
+        plot_intercept_slope("co2", df if expand_coefficients else build_calibration_model(
+            "CO2", "ppm", df, standards, start_time, prepared, anchors).get_coefficient_table(), start_date, end_date)
+
+    # plot fco2 wet at in situ temperature together with in situ temperature and salinity
+    if plot:
+        plot_fco2_in_situ(df, start_date, end_date)
+
+    # methane
+    if has_ch4:
+        if sweep_thresholds:
+            print(df_sweep_ch4.to_string(index=False))
+            export_threshold_sweep(df_sweep_ch4, "CH4", start_date, end_date)
+        if plot:
+            plot_intercept_slope("ch4", df if expand_coefficients else build_calibration_model(
+                "CH4", "ppb", df, standards, start_time, prepared, anchors).get_coefficient_table(),
+                                 start_date, end_date)
+
+        # plot concentration and pCH4 wet at in situ temperature,
+        # together with in situ temperature and salinity
+        if plot:
+            plot_ch4_in_situ(df, start_date, end_date)
+
+    # uncertainty of the in situ values
+    if uncertainty_draws:
+        df = add_uncertainty(df, standards, start_time, has_ch4, uncertainty_draws, prepared=prepared)
+
+    # export carbon data
+    export_fco2_ch4(df, start_date, end_date, has_ch4)
+
+    # export ferrybox data
+    start_t = df_fb["Time_series"].iloc[0]
+    start_str = f"{start_t.year}{start_t.month:02d}{start_t.day:02d}"
+    end_t = df_fb["Time_series"].iloc[-1]
+    end_str= f"{end_t.year}{end_t.month:02d}{end_t.day:02d}"
+    export_ferrybox_with_fco2_ch4(df, df_fb, start_str, end_str, has_ch4)
+    return df
+
+
+if __name__ == "__main__":
+    # directory for CO2 files
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2012\all_dat_files_2012'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2013\all_dat_files_2013'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2014\all_dat_files_2014'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2017\all_dat_files_2017'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2018\all_dat_files_2018'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2019\Leak'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2019'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2020'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2021'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2022'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2023'
+    co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2024'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2025'
+    # co2_folder = r'\\winfs-proj\data\proj\havgem\MOL\Teknikverksamheten\Transpaper_drift\16_CO2_data\DATA\2026'
+
+    if process_folder(co2_folder) is None:
+        sys.exit("Ingen data")
@@ -0,0 +1,125 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+from file_lock import file_lock
+from prepare_standards import GASES, PreparedStandards, get_standard_runs
+
+# one row per standard run: channel, first and last time, median and the reference values at the first and last row
+CATALOG_SCHEMA = {
+    'channel': pl.Utf8,
+    'start': pl.Datetime('us'),
+    'end': pl.Datetime('us'),
+    'median_co2': pl.Float64,
+    'reference_start_co2': pl.Float64,
+    'reference_end_co2': pl.Float64,
+    'median_ch4': pl.Float64,
+    'reference_start_ch4': pl.Float64,
+    'reference_end_ch4': pl.Float64,
+}
+
+# a run ending longer than this before the first row can not change the interpolated values, see interpolate_gaps
+NEIGHBOUR_WINDOW = timedelta(hours=12)
+
+
+def get_standards_catalog_path():
+    catalog_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "standards_catalog")
+    os.makedirs(catalog_folder, exist_ok=True)
+    return catalog_folder
+
+
+def get_partition_path(catalog_folder: str, year: int):
+    return os.path.join(catalog_folder, f'year={year}.parquet')
+
+
+#  the catalog lock is held while partitions are rewritten and while they are read, so that parallel writers do not
+#  lose runs and a reader sees all partitions of an update or none of them
+def get_catalog_lock_path(catalog_folder: str):
+    return os.path.join(catalog_folder, 'catalog.lock')
+
+
+#  method to get the standard runs of df as catalog rows, with the medians and references of prepared
+def get_catalog_runs(df: pd.DataFrame, prepared: PreparedStandards) -> pl.DataFrame:
+    times = df['time series'].to_numpy()
+    pieces = []
+    for s, standard in enumerate(prepared.standards):
+        starts, ends = get_standard_runs(df[f'is_std{standard}'].to_numpy(dtype=bool))
+        columns = {'channel': [standard] * len(starts), 'start': times[starts], 'end': times[ends - 1]}
+        for gas, _, _ in GASES:
+            if gas in prepared.medians:
+                columns[f'median_{gas}'] = prepared.medians[gas][starts, s]
+                columns[f'reference_start_{gas}'] = prepared.references[gas][starts, s]
+                columns[f'reference_end_{gas}'] = prepared.references[gas][ends - 1, s]
+            else:
+                columns.update({col: np.full(len(starts), np.nan) for col in
+                                [f'median_{gas}', f'reference_start_{gas}', f'reference_end_{gas}']})
+        pieces.append(pl.DataFrame(columns).cast(CATALOG_SCHEMA))
+    return pl.concat([pl.DataFrame(schema=CATALOG_SCHEMA)] + pieces)
+
+
+#  method to store the runs of start_time to end_time in the catalog. The catalog holds one parquet file per year of
+#  the run start, runs already stored for start_time to end_time are replaced, so processing a year again or a part of
+#  it only updates its own runs. The folders stored are expected to cover separate periods, a folder whose period
+#  encloses the period of another folder replaces the runs of that folder.
+def update_standards_catalog(catalog_folder: str, df_runs: pl.DataFrame, start_time: datetime, end_time: datetime):
+    os.makedirs(catalog_folder, exist_ok=True)
+    with file_lock(get_catalog_lock_path(catalog_folder)):
+        for year in range(start_time.year, end_time.year + 1):
+            partition_path = get_partition_path(catalog_folder, year)
+            df_year = pl.DataFrame(schema=CATALOG_SCHEMA)
+            if os.path.exists(partition_path):
+                df_year = pl.read_parquet(partition_path).filter(
+                    (pl.col('start') < start_time) | (pl.col('start') > end_time))
+            df_year = pl.concat([df_year, df_runs.filter(pl.col('start').dt.year() == year)]).sort('channel', 'start')
+            df_year.write_parquet(f'{partition_path}.{os.getpid()}.tmp')
+            os.replace(f'{partition_path}.{os.getpid()}.tmp', partition_path)
+    print(f'Standards catalog: {df_runs.height} runs stored for {start_time} - {end_time}')
+
+
+#  method to load the runs of the catalog that start in first_year to last_year, only those partitions are read
+def load_standards_catalog(catalog_folder: str, first_year: int, last_year: int) -> pl.DataFrame:
+    pieces = [pl.DataFrame(schema=CATALOG_SCHEMA)]
+    with file_lock(get_catalog_lock_path(catalog_folder)):
+        for year in range(first_year, last_year + 1):
+            partition_path = get_partition_path(catalog_folder, year)
+            if os.path.exists(partition_path):
+                pieces.append(pl.read_parquet(partition_path))
+    return pl.concat(pieces)
+
+
+#  method to get an anchor for interpolate_gaps from a catalog run
+def get_anchor(row: dict, time_col: str, origin: pd.Timestamp, gas: str, reference_col: str) -> tuple:
+    median = row[f'median_{gas}']
+    reference = row[reference_col]
+    return (np.trunc((pd.Timestamp(row[time_col]) - origin).total_seconds()),
+            np.nan if median is None else median, np.nan if reference is None else reference)
+
+
+#  method to get the catalog runs next to the rows of df as anchors for prepare_standard_matrices: for every channel
+#  the last run ending at most NEIGHBOUR_WINDOW before the first row and the first run starting after the last row,
+#  looked for until the end of the next year. Returns {standard: {gas: (before, after)}} with (elapsed time, median,
+#  reference) or None for each side, the elapsed times counted from the same origin as 'elapsed time (s)'.
+def get_neighbour_anchors(df: pd.DataFrame, catalog_folder: str, has_ch4: bool) -> dict:
+    start_time = pd.Timestamp(df['time series'].iloc[0]).to_pydatetime()
+    end_time = pd.Timestamp(df['time series'].iloc[-1]).to_pydatetime()
+    df_catalog = load_standards_catalog(catalog_folder, (start_time - NEIGHBOUR_WINDOW).year, end_time.year + 1)
+    origin = pd.Timestamp(start_time) - pd.to_timedelta(df['elapsed time (s)'].iloc[0], unit='s')
+    gases = GASES if has_ch4 else GASES[:1]
+
+    anchors = {}
+    for channel in df_catalog['channel'].unique().to_list():
+        df_channel = df_catalog.filter(pl.col('channel') == channel)
+        df_before = df_channel.filter((pl.col('end') < start_time) &
+                                      (pl.col('end') >= start_time - NEIGHBOUR_WINDOW)).sort('end').tail(1)
+        df_after = df_channel.filter(pl.col('start') > end_time).sort('start').head(1)
+        anchors[channel] = {
+            gas: (get_anchor(df_before.row(0, named=True), 'end', origin, gas, f'reference_end_{gas}')
+                  if df_before.height else None,
+                  get_anchor(df_after.row(0, named=True), 'start', origin, gas, f'reference_start_{gas}')
+                  if df_after.height else None)
+            for gas, _, _ in gases
+        }
+    return anchors
@@ -0,0 +1,105 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from calculations import correct_based_on_standards
+
+SEEDS = range(20)
+STANDARDS = ['1', '2', '3', '4']
+
+
+#  the row by row implementation of correct_based_on_standards that fit_standards replaces, one stats.linregress per
+#  row, kept as the reference the results must match exactly
+def loop_correct_based_on_standards(parameter: str, unit: str, df: pd.DataFrame, standards: list,
+                                    start_time: datetime, calibration_threshold: int = 10,
+                                    standard_threshold: int = 10) -> pd.DataFrame:
+    parameter_upper = parameter.upper()
+    parameter = parameter.lower()
+    df[f'x{parameter}_cal'] = np.nan
+    df[f'standard_slope_{parameter}'] = np.nan
+    df[f'standard_intercept_{parameter}'] = np.nan
+    df[f'standard_r_square_{parameter}'] = np.nan
+    df[f'number_of_standards_{parameter}'] = np.nan
+    df[f'QF x{parameter}_cal'] = True
+
+    values = df[f'{parameter_upper} avg {unit}'].copy()
+    is_avg = df[f'{parameter_upper} avg {unit}'].notna()
+    is_not_avg = ~is_avg
+    values.loc[is_not_avg] = df.loc[is_not_avg, f'{parameter_upper} {unit}']
+
+    if '1' in standards and len(standards) > 3 and start_time < datetime(2025, 1, 1, 0, 0, 0):
+        standards = [s for s in standards if s != '1']
+
+    for idx, value in enumerate(values):
+        interpolated_stds = []
+        reference_stds = []
+        for item in standards:
+            interpolated_stds.append(df[f'interpolated_std{item}_{parameter}'].iloc[idx])
+            reference_stds.append(df[f'reference_std{item}_{parameter}'].iloc[idx])
+        combined = [(ref, interp) for ref, interp in zip(reference_stds, interpolated_stds)
+                    if not pd.isna(ref) and not pd.isna(interp)]
+        if len(combined) < 2:
+            df.loc[idx, f'QF x{parameter}_cal'] = False
+            continue
+        combined.sort(key=lambda x: x[0])
+        reference_stds_sorted, interpolated_stds_sorted = zip(*combined)
+        slope, intercept, r, p, std_err = stats.linregress(reference_stds_sorted, interpolated_stds_sorted)
+        if not np.isfinite([slope, r]).all() or r**2 < 0.98:
+            df.loc[idx, f'QF x{parameter}_cal'] = False
+            continue
+        converted_slope = 1 / slope
+        converted_intercept = (intercept * -1) / slope
+        df.loc[idx, f'x{parameter}_cal'] = values.loc[idx] * converted_slope + converted_intercept
+        df.loc[idx, f'standard_slope_{parameter}'] = slope
+        df.loc[idx, f'standard_intercept_{parameter}'] = intercept
+        df.loc[idx, f'standard_r_square_{parameter}'] = r**2
+        df.loc[idx, f'number_of_standards_{parameter}'] = len(reference_stds_sorted)
+        for ref, interp in zip(reference_stds_sorted, interpolated_stds_sorted):
+            df.loc[idx, f'QF x{parameter}_cal'] &= abs(ref - interp) <= standard_threshold
+    df.loc[is_avg, f'QF x{parameter}_cal'] &= (df.loc[is_avg, f'QF {parameter_upper} avg {unit}'] &
+                                               ((df.loc[is_avg, f'x{parameter}_cal'] -
+                                                 df.loc[is_avg, f'{parameter_upper} avg {unit}']).abs()
+                                                <= calibration_threshold))
+    df.loc[is_not_avg, f'QF x{parameter}_cal'] &= (df.loc[is_not_avg, f'QF {parameter_upper} {unit}'] &
+                                                   ((df.loc[is_not_avg, f'x{parameter}_cal'] -
+                                                     df.loc[is_not_avg, f'{parameter_upper} {unit}']).abs()
+                                                    <= calibration_threshold))
+    return df
+
+
+#  method to make a frame with measured values and the reference and interpolated values of four standards. The
+#  references of each standard lie in their own range, the interpolated values follow them with a drift and noise,
+#  so that rows with two to four standards pass or fail the r**2 limit and the thresholds.
+def make_calibration_frame(seed: int, n: int = 150) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    slope = rng.normal(1, .02, n)
+    intercept = rng.normal(0, 3, n)
+    noise = rng.choice([.01, .5, 5], size=n, p=[.6, .3, .1])
+    df = pd.DataFrame({
+        'CO2 ppm': np.where(rng.random(n) < .1, np.nan, rng.normal(420, 20, n)),
+        'CO2 avg ppm': np.where(rng.random(n) < .5, np.nan, rng.normal(420, 20, n)),
+        'QF CO2 ppm': rng.random(n) < .9,
+        'QF CO2 avg ppm': rng.random(n) < .9,
+    })
+    for i, item in enumerate(STANDARDS):
+        reference = 300 + 100 * i + rng.normal(0, 10, n)
+        interpolated = reference * slope + intercept + rng.normal(0, 1, n) * noise
+        df[f'reference_std{item}_co2'] = np.where(rng.random(n) < .15, np.nan, reference)
+        df[f'interpolated_std{item}_co2'] = np.where(rng.random(n) < .15, np.nan, interpolated)
+    return df
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('start_time', [datetime(2024, 6, 1), datetime(2025, 6, 1)])
+def test_correct_based_on_standards_matches_loop(seed, start_time):
+    df = make_calibration_frame(seed)
+    expected = loop_correct_based_on_standards('CO2', 'ppm', df.copy(), STANDARDS, start_time)
+    result = correct_based_on_standards('CO2', 'ppm', df.copy(), STANDARDS, start_time)
+    for col in ['xco2_cal', 'standard_slope_co2', 'standard_intercept_co2', 'standard_r_square_co2',
+                'number_of_standards_co2']:
+        assert np.array_equal(result[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                              equal_nan=True), col
+    assert np.array_equal(result['QF xco2_cal'].to_numpy(dtype=bool), expected['QF xco2_cal'].to_numpy(dtype=bool))
@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+
+from file_reader import read_files_dynamic
+
+HEADER = ' Type\terror\tPC Date\tPC Time\tequ temp\tstd val\tCO2 um/m\t CO2 avg ppm\tequ press'
+
+
+#  method to write a legacy GO file with one row per minute from start, the first row with first_type
+def write_go_file(path, start: datetime, rows: int, first_type: str = 'EQU'):
+    lines = [HEADER]
+    for i in range(rows):
+        time = start + timedelta(minutes=i)
+        row_type = first_type if i == 0 else 'EQU'
+        lines.append(f'{row_type}\t0\t{time:%d/%m/%y}\t{time:%H:%M:%S}\t20,{i % 10}\t0\t{400 + i % 7},5\t\t1,2')
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+
+@pytest.mark.parametrize('window', ['1h', '1d'])
+@pytest.mark.parametrize('first_type', ['EQU', 'XBAD'])
+def test_windowed_read_matches_full_read(window, first_type, tmp_path):
+    file_list = [
+        write_go_file(tmp_path / 'a_dat.txt', datetime(2024, 3, 1, 0, 0), 150, first_type),
+        write_go_file(tmp_path / 'b_dat.txt', datetime(2024, 3, 1, 2, 0), 150),
+    ]
+    df, df_extra = read_files_dynamic(file_list)
+    df_windowed, df_extra_windowed = read_files_dynamic(file_list, window=window)
+
+    # elapsed time (s) starts at the first row kept by the filters in both reads
+    assert df['elapsed time (s)'][0] == 0
+    assert df_windowed.equals(df)
+    assert df_extra_windowed.equals(df_extra)
+    assert df_windowed.height == (299 if first_type == 'XBAD' else 300)
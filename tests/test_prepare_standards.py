@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from prepare_standards import (get_overlapping_periods, get_run_medians, get_standard_reference_value,
+                               get_standard_runs, prepare_all_standards)
+
+SEEDS = range(100)
+
+
+#  the row by row implementation of get_median_and_interpolate that the vectorized functions replace, kept as the
+#  reference the results must match exactly
+def loop_median_and_interpolate(has_ch4: bool, df: pd.DataFrame, standard: str):
+    bool_col = f'is_std{standard}'
+    co2_values = df['CO2 ppm'].copy()
+    is_co2_avg = df['CO2 avg ppm'].notna()
+    co2_values.loc[is_co2_avg] = df.loc[is_co2_avg, 'CO2 avg ppm']
+    if has_ch4:
+        ch4_values = df['CH4 ppb'].copy()
+        is_ch4_avg = df['CH4 avg ppb'].notna()
+        ch4_values.loc[is_ch4_avg] = df.loc[is_ch4_avg, 'CH4 avg ppb']
+    df[f'median_std{standard}_co2'] = np.nan
+    if has_ch4:
+        df[f'median_std{standard}_ch4'] = np.nan
+    bool_series_diff = df[bool_col].astype(int).diff().fillna(0)
+
+    if df[bool_col].iloc[0] == 1:
+        bool_series_diff.iloc[0] = 1
+
+    if df[bool_col][len(df[bool_col]) - 1] == 1:
+        bool_series_diff[len(df[bool_col])] = -1
+
+    start_indices = bool_series_diff[bool_series_diff == 1].index
+    end_indices = bool_series_diff[bool_series_diff == -1].index
+    for start_idx, end_idx in zip(start_indices, end_indices):
+        temp_values = co2_values.iloc[start_idx:end_idx].values
+        if np.all(np.isnan(temp_values)):
+            median_value = np.nan
+        else:
+            median_value = np.nanmedian(temp_values)
+        df.loc[start_idx:end_idx - 1, f'median_std{standard}_co2'] = median_value
+        if has_ch4:
+            temp_values = ch4_values.iloc[start_idx:end_idx].values
+            if np.all(np.isnan(temp_values)):
+                median_value = np.nan
+            else:
+                median_value = np.nanmedian(temp_values)
+            df.loc[start_idx:end_idx - 1, f'median_std{standard}_ch4'] = median_value
+
+    # interpolate
+    df[f'interpolated_std{standard}_co2'] = np.nan
+    df[f'interpolated_std{standard}_co2'].values[~np.isnan(df[f'median_std{standard}_co2'])] = (
+        df[f'median_std{standard}_co2'].values)[~np.isnan(df[f'median_std{standard}_co2'])]
+    if has_ch4:
+        df[f'interpolated_std{standard}_ch4'] = np.nan
+        df[f'interpolated_std{standard}_ch4'].values[~np.isnan(df[f'median_std{standard}_ch4'])] = (
+            df[f'median_std{standard}_ch4'].values)[~np.isnan(df[f'median_std{standard}_ch4'])]
+
+    for gas in (['co2', 'ch4'] if has_ch4 else ['co2']):
+        for i in range(len(start_indices) - 1):
+            end_time = df.loc[end_indices[i] - 1, 'elapsed time (s)']
+            gap_between_std_curves = df.loc[start_indices[i + 1], 'elapsed time (s)'] - end_time > 12 * 3600
+            bool_gap_between_std_curves = ((df['elapsed time (s)'] > end_time) &
+                                           (df['elapsed time (s)'] <= end_time + 12 * 3600))
+            if gap_between_std_curves:
+                df.loc[bool_gap_between_std_curves, f'interpolated_std{standard}_{gas}'] = df.loc[
+                    end_indices[i] - 1, f'median_std{standard}_{gas}']
+            elif (df.loc[start_indices[i + 1], f'reference_std{standard}_{gas}'] ==
+                  df.loc[end_indices[i] - 1, f'reference_std{standard}_{gas}']):
+                df.loc[end_indices[i]:start_indices[i + 1] - 1, f'interpolated_std{standard}_{gas}'] = \
+                    (np.interp(df.loc[end_indices[i]:start_indices[i + 1] - 1, 'elapsed time (s)'].values,
+                               df.loc[[end_indices[i] - 1, start_indices[i + 1]], 'elapsed time (s)'].values,
+                               df.loc[[end_indices[i] - 1, start_indices[i + 1]],
+                                      f'median_std{standard}_{gas}'].values))
+            else:
+                df.loc[end_indices[i]:start_indices[i + 1] - 1, f'interpolated_std{standard}_{gas}'] = df.loc[
+                    end_indices[i] - 1, f'median_std{standard}_{gas}']
+    return df
+
+
+#  method to make a frame with two standards: runs of 1-8 rows at random positions, runs at the first and last row,
+#  repeated time stamps, gaps longer than 12 hours, missing and all missing values, a single run of STD3 and
+#  reference values that change or are missing
+def make_standards_frame(seed: int, n: int = 400) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    elapsed = rng.choice([10, 60, 3600, 13 * 3600, 0], size=n, p=[.6, .25, .1, .03, .02]).cumsum()
+    elapsed -= elapsed[0]
+    types = np.full(n, 'EQU', dtype=object)
+    i = int(rng.integers(0, 3))
+    while i < n:
+        length = int(rng.integers(1, 8))
+        types[i:i + length] = 'STD2'
+        i += length + int(rng.integers(1, 40))
+    if rng.random() < .5:
+        types[-int(rng.integers(1, 4)):] = 'STD2'
+    single = int(rng.integers(0, n - 5))
+    types[single:single + int(rng.integers(1, 5))] = 'STD3'
+
+    df = pd.DataFrame({
+        'Type': types,
+        'CO2 ppm': np.where(rng.random(n) < .2, np.nan, rng.normal(400, 5, n)),
+        'CO2 avg ppm': np.where(rng.random(n) < .5, np.nan, rng.normal(400, 5, n)),
+        'CH4 ppb': np.where(rng.random(n) < .1, np.nan, rng.normal(2000, 5, n)),
+        'CH4 avg ppb': np.nan,
+        'elapsed time (s)': elapsed.astype(np.int64),
+        'time series': pd.Timestamp('2024-01-01') + pd.to_timedelta(elapsed, unit='s'),
+    })
+    # a run whose values are all missing
+    run = np.flatnonzero(types == 'STD2')[:3]
+    df.loc[run, ['CO2 ppm', 'CO2 avg ppm']] = np.nan
+    for standard in ['2', '3']:
+        df[f'is_std{standard}'] = df['Type'] == f'STD{standard}'
+        for gas, value in [('co2', 401.0), ('ch4', 2001.0)]:
+            reference = np.where(np.arange(n) < n * rng.random(), value, value + 1)
+            df[f'reference_std{standard}_{gas}'] = np.where(rng.random(n) < .05, np.nan, reference)
+    return df
+
+
+#  the row by row implementation of get_standard_reference_value, one full frame mask per cylinder
+def loop_standard_reference_value(has_ch4: bool, df: pd.DataFrame, df_stds: pd.DataFrame):
+    for _, row in df_stds.iterrows():
+        standard = str(row['STD channel'])
+        if df['Type'].str.contains(standard).any():
+            if f'reference_{standard.lower()}_co2' not in df.columns:
+                df[f'reference_{standard.lower()}_co2'] = np.nan
+            if f'reference_{standard.lower()}_ch4' not in df.columns and has_ch4:
+                df[f'reference_{standard.lower()}_ch4'] = np.nan
+            bool_ref = (df['time series'] >= row['Start time series']) & (df['time series'] <= row['End time series'])
+            df.loc[bool_ref, f'reference_{standard.lower()}_co2'] = row['CO2 ppm']
+            if has_ch4:
+                df.loc[bool_ref, f'reference_{standard.lower()}_ch4'] = row['CH4 ppb']
+    return df
+
+
+#  method to make a standards sheet and a frame for it: cylinder periods that follow, overlap or miss their start or
+#  end, a channel that is not in Type, and times with repeats and NaT, sorted or shuffled
+def make_reference_frames(seed: int, n: int = 300):
+    rng = np.random.default_rng(seed)
+    origin = pd.Timestamp('2024-01-01')
+    rows = []
+    for channel in ['STD1', 'STD2', 'STD3', 'STD4']:
+        start = origin - pd.Timedelta(days=int(rng.integers(0, 3)))
+        for _ in range(int(rng.integers(1, 5))):
+            end = start + pd.Timedelta(hours=int(rng.integers(1, 60)))
+            rows.append({'STD channel': channel, 'Start time series': start, 'End time series': end,
+                         'CO2 ppm': rng.normal(400, 20), 'CH4 ppb': rng.normal(2000, 50)})
+            # the next cylinder starts after, at or before the end of this one
+            start = end + pd.Timedelta(hours=int(rng.integers(-10, 5)))
+    df_stds = pd.DataFrame(rows).sample(frac=1, random_state=seed).reset_index(drop=True)
+    missing = rng.random(len(df_stds)) < .1
+    df_stds.loc[missing, rng.choice(['Start time series', 'End time series'])] = pd.NaT
+
+    times = origin + pd.to_timedelta(np.sort(rng.integers(-2 * 24 * 60, 8 * 24 * 60, n)), unit='min')
+    times = pd.Series(times).where(rng.random(n) > .03)
+    if rng.random() < .5:
+        times = times.sample(frac=1, random_state=seed).reset_index(drop=True)
+    df = pd.DataFrame({'Type': rng.choice(['EQU', 'ATM', 'STD1', 'STD2', 'STD3'], n), 'time series': times})
+    return df, df_stds
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_standard_runs_match_diff(seed):
+    is_std = make_standards_frame(seed)['is_std2'].to_numpy()
+    edges = np.diff(is_std.astype(int), prepend=0, append=0)
+    starts, ends = get_standard_runs(is_std)
+    assert np.array_equal(starts, np.flatnonzero(edges == 1))
+    assert np.array_equal(ends, np.flatnonzero(edges == -1))
+    assert np.array_equal(get_standard_runs(np.zeros(5, dtype=bool))[0], np.empty(0))
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_run_medians_match_nanmedian(seed):
+    df = make_standards_frame(seed)
+    values = np.column_stack([df['CO2 ppm'], df['CH4 ppb']])
+    starts, ends = get_standard_runs(df['is_std2'].to_numpy())
+    expected = np.array([[np.nan if np.isnan(values[start:end, k]).all() else np.nanmedian(values[start:end, k])
+                          for k in range(2)] for start, end in zip(starts, ends)]).reshape(-1, 2)
+    assert np.array_equal(get_run_medians(values, starts, ends), expected, equal_nan=True)
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('has_ch4', [True, False])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_prepared_medians_match_loop(seed, has_ch4):
+    df = make_standards_frame(seed)
+    df_new, prepared = prepare_all_standards(has_ch4, df.copy())
+    assert prepared.standards == ['2', '3']
+    for standard in prepared.standards:
+        df_loop = loop_median_and_interpolate(has_ch4, df.copy(), standard)
+        for gas in (['co2', 'ch4'] if has_ch4 else ['co2']):
+            col = f'median_std{standard}_{gas}'
+            assert np.array_equal(df_new[col].to_numpy(), df_loop[col].to_numpy(), equal_nan=True), col
+            assert np.array_equal(prepared.get_medians(gas, standard), df_loop[col].to_numpy(), equal_nan=True)
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('has_ch4', [True, False])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_interpolated_match_loop(seed, has_ch4):
+    df = make_standards_frame(seed)
+    df_new, prepared = prepare_all_standards(has_ch4, df.copy())
+    _, prepared_arrays = prepare_all_standards(has_ch4, df.copy(), write_columns=False)
+    for standard in prepared.standards:
+        df_loop = loop_median_and_interpolate(has_ch4, df.copy(), standard)
+        for gas in (['co2', 'ch4'] if has_ch4 else ['co2']):
+            col = f'interpolated_std{standard}_{gas}'
+            expected = df_loop[col].to_numpy()
+            assert np.array_equal(df_new[col].to_numpy(), expected, equal_nan=True), col
+            _, interpolated = prepared_arrays.get_matrices(gas, [standard])
+            assert np.array_equal(interpolated[:, 0], expected, equal_nan=True), col
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('gap', [60, 12 * 3600, 12 * 3600 + 1, 30 * 3600])
+def test_interpolated_single_gap_matches_loop(gap):
+    # two runs of one standard around a gap of exactly, just over and far over 12 hours
+    elapsed = np.array([0, 10, 20, 20 + gap // 3, 20 + gap // 2, 20 + gap, 30 + gap, 40 + gap])
+    df = make_standards_frame(0, len(elapsed))
+    df['elapsed time (s)'] = elapsed
+    df['time series'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(elapsed, unit='s')
+    df['Type'] = ['STD2', 'STD2', 'STD2', 'EQU', 'EQU', 'STD2', 'STD2', 'EQU']
+    df['is_std2'] = df['Type'] == 'STD2'
+    df['is_std3'] = False
+    df['CO2 ppm'] = [400.0, 401.0, 402.0, 0.0, 0.0, 410.0, 411.0, 0.0]
+    df['CO2 avg ppm'] = np.nan
+    for same_reference in [True, False]:
+        df['reference_std2_co2'] = [401.0] * 5 + [401.0 if same_reference else 402.0] * 3
+        df_new, _ = prepare_all_standards(False, df.copy())
+        df_loop = loop_median_and_interpolate(False, df.copy(), '2')
+        assert np.array_equal(df_new['interpolated_std2_co2'].to_numpy(),
+                              df_loop['interpolated_std2_co2'].to_numpy(), equal_nan=True)
+
+
+@pytest.mark.filterwarnings('ignore')
+@pytest.mark.parametrize('has_ch4', [True, False])
+@pytest.mark.parametrize('seed', SEEDS)
+def test_reference_values_match_loop(seed, has_ch4):
+    df, df_stds = make_reference_frames(seed)
+    df_new = get_standard_reference_value(has_ch4, df.copy(), df_stds)
+    df_loop = loop_standard_reference_value(has_ch4, df.copy(), df_stds)
+    assert list(df_new.columns) == list(df_loop.columns)
+    assert 'reference_std4_co2' not in df_new.columns
+    for col in df_loop.columns[2:]:
+        assert np.array_equal(df_new[col].to_numpy(dtype=float), df_loop[col].to_numpy(dtype=float),
+                              equal_nan=True), col
+
+
+def test_overlapping_periods():
+    day = pd.Timestamp('2024-01-01')
+    df_stds = pd.DataFrame({
+        'STD channel': ['STD1', 'STD1', 'STD2', 'STD1', 'STD2'],
+        'Start time series': [day, day + pd.Timedelta(hours=10), day, day + pd.Timedelta(hours=30),
+                              day + pd.Timedelta(hours=5)],
+        'End time series': [day + pd.Timedelta(hours=20), day + pd.Timedelta(hours=15), day + pd.Timedelta(hours=5),
+                            day + pd.Timedelta(hours=40), day + pd.Timedelta(hours=9)],
+    })
+    df_overlaps = get_overlapping_periods(df_stds)
+    # the second STD1 period lies within the first, the STD2 periods touch at 5 hours, the last STD1 period is apart
+    assert df_overlaps[['STD channel', 'first row', 'second row']].values.tolist() == [['STD1', 0, 1],
+                                                                                        ['STD2', 2, 4]]
+    assert df_overlaps['overlap end'].tolist() == [day + pd.Timedelta(hours=15), day + pd.Timedelta(hours=5)]
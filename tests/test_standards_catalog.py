@@ -0,0 +1,68 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from calibration_model import build_calibration_model
+from prepare_standards import prepare_all_standards
+from standards_catalog import get_catalog_runs, get_neighbour_anchors, update_standards_catalog
+from test_prepare_standards import make_standards_frame
+
+
+#  method to split a frame in three periods at rows outside the standard runs, each period with elapsed time (s)
+#  counted from its own first row as when its folder is read on its own
+def split_frame(df, rng):
+    is_std = df['is_std2'].to_numpy() | df['is_std3'].to_numpy()
+    elapsed = df['elapsed time (s)'].to_numpy()
+    candidates = np.flatnonzero(~is_std[1:-1] & ~is_std[:-2] & (elapsed[1:-1] > elapsed[:-2])) + 1
+    splits = np.sort(rng.choice(candidates, 2, replace=False))
+    parts = []
+    for start, end in zip([0, *splits], [*splits, len(df)]):
+        part = df.iloc[start:end].reset_index(drop=True)
+        part['elapsed time (s)'] -= part['elapsed time (s)'].iloc[0]
+        parts.append((slice(start, end), part))
+    return parts
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_split_periods_match_full_period(seed, tmp_path):
+    df = make_standards_frame(seed, 600)
+    _, prepared_full = prepare_all_standards(True, df.copy(), write_columns=False)
+    parts = split_frame(df, np.random.default_rng(seed))
+
+    # all periods are stored before any period reads the runs of its neighbours
+    for _, part in parts:
+        _, prepared = prepare_all_standards(True, part.copy(), write_columns=False)
+        update_standards_catalog(str(tmp_path), get_catalog_runs(part, prepared), part['time series'].iloc[0],
+                                 part['time series'].iloc[-1])
+
+    for rows, part in parts:
+        anchors = get_neighbour_anchors(part, str(tmp_path), True)
+        _, prepared = prepare_all_standards(True, part.copy(), write_columns=False, anchors=anchors)
+        for gas in ['co2', 'ch4']:
+            _, interpolated_full = prepared_full.get_matrices(gas, prepared.standards)
+            _, interpolated = prepared.get_matrices(gas, prepared.standards)
+            assert np.array_equal(interpolated, interpolated_full[rows], equal_nan=True), (rows, gas)
+
+
+@pytest.mark.parametrize('seed', range(30))
+def test_calibration_model_uses_anchors(seed, tmp_path):
+    df = make_standards_frame(seed, 600)
+    # the knots give the per row values for unique time stamps only, see calibration_model.get_standard_knots
+    df = df[~df['elapsed time (s)'].duplicated(keep=False)].reset_index(drop=True)
+    df['elapsed time (s)'] -= df['elapsed time (s)'].iloc[0]
+    parts = split_frame(df, np.random.default_rng(seed))
+    for _, part in parts:
+        _, prepared = prepare_all_standards(True, part.copy(), write_columns=False)
+        update_standards_catalog(str(tmp_path), get_catalog_runs(part, prepared), part['time series'].iloc[0],
+                                 part['time series'].iloc[-1])
+
+    for _, part in parts:
+        anchors = get_neighbour_anchors(part, str(tmp_path), True)
+        _, prepared = prepare_all_standards(True, part.copy(), write_columns=False, anchors=anchors)
+        for gas in ['co2', 'ch4']:
+            model = build_calibration_model(gas, '', part, prepared.standards, datetime(2025, 1, 1), prepared,
+                                            anchors)
+            _, interpolated = prepared.get_matrices(gas, model.standards)
+            _, knots = model.get_standard_matrices(part['elapsed time (s)'].to_numpy(dtype=float))
+            assert np.array_equal(knots, interpolated, equal_nan=True), gas
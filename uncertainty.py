@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from calculations import (get_calibration_standards, get_standard_matrices, fit_standards, calculate_ph2o,
+                          calculate_fco2, calculate_bunsen_solubility_coefficient, seawater_density_at_1_atm)
+from compact_frame import get_flag
+from prepare_standards import PreparedStandards
+
+# Molar volume for an ideal gas at 1 atm (101.325 kPa) from NIST:
+VM = 22.41396954  # L mol-1
+
+# default standard uncertainties (1 sigma) of the perturbed inputs, temperatures in °C and pressure in hPa. The
+# uncertainty of xCO2 and xCH4 is taken from the calibration fit of each row.
+DEFAULT_SIGMAS = {
+    'equ temp': 0.05,
+    'SST': 0.05,
+    'SSS': 0.1,
+    'pressure': 0.5,
+}
+
+PERCENTILES = [2.5, 50, 97.5]
+
+# upper limit of rows x draws evaluated at once
+CHUNK_ELEMENTS = 2_000_000
+
+
+#  method to get the name of a percentile column, e.g. fco2_wet_sst_p97.5
+def get_percentile_column(col: str, percentile: float) -> str:
+    return f'{col}_p{percentile:g}'
+
+
+#  method to get the standard uncertainty of the calibrated xCO2 or xCH4 of each row. It is the residual standard
+#  deviation of the standards around the fitted line, converted to the measured scale by dividing with the slope.
+def get_calibration_sigma(df: pd.DataFrame, parameter: str, standards: list, start_time: datetime,
+                          prepared: PreparedStandards = None) -> np.ndarray:
+    parameter = parameter.lower()
+    references, interpolated = get_standard_matrices(df, parameter, get_calibration_standards(standards, start_time),
+                                                     prepared)
+    fit = fit_standards(references, interpolated)
+    slope = np.where(fit['is_fit'], fit['slope'], np.nan)
+    intercept = np.where(fit['is_fit'], fit['intercept'], np.nan)
+    residuals = interpolated - (slope[:, None] * references + intercept[:, None])
+    is_pair = ~np.isnan(residuals)
+    number_of_standards = is_pair.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residual_std = np.sqrt(np.where(is_pair, residuals**2, 0).sum(axis=1) / np.maximum(number_of_standards - 2, 1))
+        return residual_std / np.abs(slope)
+
+
+#  method to draw n_draws normally distributed values around each value, sigma is a scalar or one value per row
+def draw(rng: np.random.Generator, values: np.ndarray, sigma, n_draws: int) -> np.ndarray:
+    sigma = np.asarray(sigma, dtype=float)
+    if sigma.ndim:
+        sigma = sigma[:, None]
+    return values[:, None] + rng.standard_normal((len(values), n_draws)) * sigma
+
+
+#  method to simulate pco2 and fco2 at in situ temperature for equ rows, returns (rows x draws) arrays
+def simulate_co2(rng: np.random.Generator, inputs: dict, sigmas: dict, n_draws: int) -> dict:
+    xco2 = draw(rng, inputs['xco2_cal'], inputs['sigma'], n_draws)
+    equ_temp = draw(rng, inputs['equ temp'], sigmas['equ temp'], n_draws)
+    sst = draw(rng, inputs['SST'], sigmas['SST'], n_draws)
+    sss = draw(rng, inputs['SSS'], sigmas['SSS'], n_draws)
+    p_equ = draw(rng, inputs['P_equ'], sigmas['pressure'] / 1013.25, n_draws)
+    pco2_wet = xco2 * (p_equ - calculate_ph2o(equ_temp, sss))
+    fco2_wet = calculate_fco2(equ_temp, p_equ, pco2_wet, xco2)
+    factor = np.exp(0.0423 * (sst - equ_temp))
+    return {'pco2_wet_sst': pco2_wet * factor, 'fco2_wet_sst': fco2_wet * factor}
+
+
+#  method to simulate the ch4 concentration and pch4 at in situ temperature, returns (rows x draws) arrays. As in the
+#  calculation chain the pressure and the temperature for ph2o are those of the equilibrator for equ rows and those of
+#  the atmosphere for other rows.
+def simulate_ch4(rng: np.random.Generator, inputs: dict, sigmas: dict, n_draws: int) -> dict:
+    xch4 = draw(rng, inputs['xch4_cal'], inputs['sigma'], n_draws)
+    equ_temp = draw(rng, inputs['equ temp'], sigmas['equ temp'], n_draws)
+    sst = draw(rng, inputs['SST'], sigmas['SST'], n_draws)
+    sss = draw(rng, inputs['SSS'], sigmas['SSS'], n_draws)
+    pressure = draw(rng, inputs['pressure'], sigmas['pressure'] / 1013.25, n_draws)
+    is_equ = inputs['is_equ'][:, None]
+    pch4_wet = xch4 * (pressure - calculate_ph2o(np.where(is_equ, equ_temp, sst), sss))
+    ch4_nmol_kg = (pch4_wet * calculate_bunsen_solubility_coefficient(equ_temp, sss) /
+                   (VM * seawater_density_at_1_atm(equ_temp, sss)))
+    pch4_wet_sst = (ch4_nmol_kg * seawater_density_at_1_atm(sst, sss) /
+                    (calculate_bunsen_solubility_coefficient(sst, sss) / VM))
+    return {'ch4_nmol_kg': ch4_nmol_kg, 'pch4_wet_sst': np.where(is_equ, pch4_wet_sst, np.nan)}
+
+
+#  method to run a simulation over the rows in chunks of at most chunk_elements rows x draws and write the
+#  percentiles of each output as new columns
+def add_simulated_percentiles(df: pd.DataFrame, rows: np.ndarray, inputs: dict, simulate, outputs: list,
+                              rng: np.random.Generator, sigmas: dict, n_draws: int,
+                              chunk_elements: int = CHUNK_ELEMENTS) -> pd.DataFrame:
+    percentiles = {(col, q): np.full(len(df), np.nan) for col in outputs for q in PERCENTILES}
+    chunk_rows = max(1, chunk_elements // n_draws)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = slice(start, start + chunk_rows)
+        simulated = simulate(rng, {key: values[chunk] for key, values in inputs.items()}, sigmas, n_draws)
+        for col in outputs:
+            for q, value in zip(PERCENTILES, np.percentile(simulated[col], PERCENTILES, axis=1)):
+                percentiles[(col, q)][rows[chunk]] = value
+    for (col, q), values in percentiles.items():
+        # only keep the percentiles where the output itself exists
+        df[get_percentile_column(col, q)] = np.where(df[col].notna(), values, np.nan)
+    return df
+
+
+#  method to propagate the uncertainties of the inputs to fco2_wet_sst, pco2_wet_sst and, with ch4, to ch4_nmol_kg and
+#  pch4_wet_sst with a Monte Carlo simulation of n_draws per row. xCO2 and xCH4 are perturbed with the uncertainty of
+#  the calibration fit, temperatures, salinity and pressure with sigmas (DEFAULT_SIGMAS unless given). The 2.5, 50
+#  and 97.5 percentiles are added as columns, e.g. fco2_wet_sst_p2.5.
+def add_uncertainty(df: pd.DataFrame, standards: list, start_time: datetime, has_ch4: bool, n_draws: int = 1000,
+                    sigmas: dict = None, seed: int = 0, prepared: PreparedStandards = None) -> pd.DataFrame:
+    sigmas = {**DEFAULT_SIGMAS, **(sigmas or {})}
+    rng = np.random.default_rng(seed)
+    is_equ = get_flag(df, 'is_equ').to_numpy()
+
+    rows = np.flatnonzero(df['fco2_wet_sst'].notna().to_numpy() | df['pco2_wet_sst'].notna().to_numpy())
+    inputs = {col: df[col].to_numpy(dtype=float)[rows] for col in ['xco2_cal', 'equ temp', 'SST', 'SSS', 'P_equ']}
+    inputs['sigma'] = get_calibration_sigma(df, 'co2', standards, start_time, prepared)[rows]
+    df = add_simulated_percentiles(df, rows, inputs, simulate_co2, ['pco2_wet_sst', 'fco2_wet_sst'], rng, sigmas,
+                                   n_draws)
+
+    if has_ch4:
+        rows = np.flatnonzero(df['ch4_nmol_kg'].notna().to_numpy())
+        inputs = {col: df[col].to_numpy(dtype=float)[rows] for col in ['xch4_cal', 'equ temp', 'SST', 'SSS']}
+        inputs['pressure'] = np.where(is_equ, df['P_equ'].to_numpy(dtype=float),
+                                      df['P_atm_sea'].to_numpy(dtype=float))[rows]
+        inputs['is_equ'] = is_equ[rows]
+        inputs['sigma'] = get_calibration_sigma(df, 'ch4', standards, start_time, prepared)[rows]
+        df = add_simulated_percentiles(df, rows, inputs, simulate_ch4, ['ch4_nmol_kg', 'pch4_wet_sst'], rng, sigmas,
+                                       n_draws)
+    return df